@@ -2,10 +2,13 @@
 
 import math
 import numpy as np
-import heapq
 import collections
 import copy
 
+from priorityqueue import IndexedPriorityQueue
+
+SQRT2 = math.sqrt(2.0)
+
 
 def dist_between(point_a, point_b):
     """
@@ -33,12 +36,12 @@ class AStar(object):
         self.height = field.height
         self.field = field
 
+        # Whole grid heuristic arrays, keyed by (heuristic, goal)
+        self.heuristic_grids = {}
         self.heuristic_cost_estimate = heuristic_cost_estimate
 
         self.g_score = np.zeros(self.width * self.height, dtype=float)\
                          .reshape(self.width, self.height)
-        self.h_score = np.zeros(self.width * self.height, dtype=float)\
-                         .reshape(self.width, self.height)
         self.f_score = np.zeros(self.width * self.height, dtype=float)\
                          .reshape(self.width, self.height)
 
@@ -47,21 +50,59 @@ class AStar(object):
 
         # The set of tentative nodes to be evaluated, initially containing the
         # start node
-        self.openset = [(self.f_score[start], start)]
-        heapq.heapify(self.openset)
+        self.openset = IndexedPriorityQueue()
 
-        # The map of navigated nodes.
-        self.came_from = {start: None}
+        # The map of navigated nodes, the flat index (x * height + y) of the
+        # cell each cell was reached from, -1 if it hasn't been.
+        self.parent = np.empty(self.width * self.height, dtype=np.int32)
+        self.parent.fill(-1)
 
-        # The path to the goal
-        self.path = []
+        # The path to the goal, an (N, 2) array of x, y
+        self.path = np.zeros((0, 2), dtype=int)
 
         # Cost from start along best known path.
         self.g_score[start] = 0
-        self.h_score[start] = self.heuristic_cost_estimate(field, start, goal)
+        if not self.h_precomputed:
+            self.h_score[start] = self.heuristic_cost_estimate(field, start,
+                                                               goal)
 
         # Estimated total cost from start to goal through y.
         self.f_score[start] = self.g_score[start] + self.h_score[start]
+        self.openset.push(start, self.f_score[start])
+
+        # Search statistics
+        self.expanded = 0
+        self.peak_open = 1
+
+    def get_heuristic_cost_estimate(self):
+        return self._heuristic_cost_estimate
+
+    def set_heuristic_cost_estimate(self, heuristic):
+        """
+        Sets the heuristic, precomputing it for the whole grid when it has a
+        vectorized form so the search only has to look values up.
+        """
+        self._heuristic_cost_estimate = heuristic
+        grid = self.get_heuristic_grid(heuristic, self.goal)
+        self.h_precomputed = grid is not None
+        if self.h_precomputed:
+            self.h_score = grid
+        else:
+            self.h_score = np.zeros((self.width, self.height), dtype=float)
+
+    heuristic_cost_estimate = property(get_heuristic_cost_estimate,
+                                       set_heuristic_cost_estimate)
+
+    def get_heuristic_grid(self, heuristic, goal):
+        """
+        Returns the heuristic evaluated over the whole field towards goal, or
+        None if the heuristic has no vectorized form.  Grids are cached.
+        """
+        key = (heuristic, goal)
+        if key not in self.heuristic_grids:
+            self.heuristic_grids[key] = heuristic_grid(heuristic, self.width,
+                                                       self.height, goal)
+        return self.heuristic_grids[key]
 
     def solve(self):
         """
@@ -78,8 +119,8 @@ class AStar(object):
         """
         max_cell = self.field.data.max() * -1.0
         max_counter = 0
-        self.field[self.field.data == -1] = max_cell / 2.0
-        if self.path:
+        with self.field.batch():
+            self.field[self.field.data == -1] = max_cell / 2.0
             for (x, y) in self.path:
                 max_counter += 1
                 self.field[x, y] = -20
@@ -99,53 +140,74 @@ class AStar(object):
         """
         # Find the lowest scoring node in the openset
         try:
-            current_node = heapq.heappop(self.openset)
+            current_node = self.openset.pop()
         except IndexError:
             return False
         x = current_node[1]
+        self.expanded += 1
 
         if x == self.goal:
-            if x == self.goal and x == self.start:
-                self.path = []
-            else:
-                self.path = reconstruct_path(self.came_from,
-                                             self.came_from[self.goal])
-            self.path.append(self.goal)
+            self.path = self.build_path()
             self.draw_path()
             return False
 
         self.closedset.add(x)
-        for y in self.field.get_neighbors(*x):
-            # If the value is in the closedset we don't need to revisit it
-            if y in self.closedset:
-                continue
-            if self.field[y] == -1:
-                continue
+        for y, cost in self.successors(x):
+            tentative_g_score = self.g_score[x] + cost
 
-            tentative_g_score = self.g_score[x] + dist_between(x, y)
-
-            # Strip out the f_scores from the openset and check if it exists
-            if y not in [v[1] for v in self.openset]:
-                self.came_from[y] = x
+            if y not in self.openset:
+                self.parent[self.index(y)] = self.index(x)
                 self.g_score[y] = tentative_g_score
-                self.h_score[y] = self.heuristic_cost_estimate(self.field,
-                                                               y,
-                                                               self.goal)
+                if not self.h_precomputed:
+                    self.h_score[y] = self.heuristic_cost_estimate(self.field,
+                                                                   y,
+                                                                   self.goal)
                 self.f_score[y] = self.g_score[y] + self.h_score[y]
                 self.field[y] = self.f_score[y]
-                heapq.heappush(self.openset, (self.f_score[y], y))
+                self.openset.push(y, self.f_score[y])
             elif tentative_g_score < self.g_score[y]:
-                self.came_from[y] = x
+                # The h_score is unchanged, only the path to y got cheaper
+                self.parent[self.index(y)] = self.index(x)
                 self.g_score[y] = tentative_g_score
-                self.h_score[y] = self.heuristic_cost_estimate(self.field,
-                                                               y,
-                                                               self.goal)
                 self.f_score[y] = self.g_score[y] + self.h_score[y]
                 self.field[y] = self.f_score[y]
+                self.openset.push(y, self.f_score[y])
+        self.peak_open = max(self.peak_open, len(self.openset))
         return True
 
+    def successors(self, x):
+        """
+        Yields (cell, cost) for every cell that can be reached directly from x.
+        """
+        for y in self.field.get_neighbors(*x):
+            # If the value is in the closedset we don't need to revisit it
+            if y in self.closedset:
+                continue
+            if self.field[y] == -1:
+                continue
+            yield y, dist_between(x, y)
+
+    def index(self, cell):
+        """Returns the flat index of a cell in the parent array"""
+        return cell[0] * self.height + cell[1]
+
+    def parent_of(self, cell):
+        """Returns the cell that cell was reached from, or None"""
+        parent = self.parent[self.index(cell)]
+        if parent == -1:
+            return None
+        return divmod(int(parent), self.height)
 
-# 3 distinct heuristics
+    def build_path(self, tail=None):
+        """
+        Returns the path from start to goal once the goal has been reached,
+        only the last tail cells of it if tail is given.
+        """
+        return extract_path(self.parent, self.index(self.goal), self.height,
+                            tail)
+
+
+# 4 distinct heuristics
 # I include the field incase future heuristics need to access values from it.
 def crow(f, cell0, cell1):
     "A hypotense of a triangle."
@@ -164,16 +226,93 @@ def naive(f, cell0, cell1):
     return 0
 
 
+def octile(f, cell0, cell1):
+    """
+    Calculate the octile distance, the exact cost of an unobstructed path
+    on the 8-connected grid.
+    """
+    dx = abs(cell1[0] - cell0[0])
+    dy = abs(cell1[1] - cell0[1])
+    return max(dx, dy) + (SQRT2 - 1.0) * min(dx, dy)
+
+
+# Vectorized forms of the heuristics, these take broadcastable arrays of the
+# absolute x and y offsets to the goal.
+def crow_grid(dx, dy):
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def manhattan_grid(dx, dy):
+    return dx + dy
+
+
+def naive_grid(dx, dy):
+    return np.zeros(np.broadcast(dx, dy).shape)
+
+
+def octile_grid(dx, dy):
+    return np.maximum(dx, dy) + (SQRT2 - 1.0) * np.minimum(dx, dy)
+
+
+vectorized_heuristics = {
+    crow: crow_grid,
+    manhattan: manhattan_grid,
+    naive: naive_grid,
+    octile: octile_grid,
+}
+
+
+def heuristic_grid(heuristic, width, height, goal):
+    """
+    Evaluates a heuristic for every cell of a width x height grid in one
+    NumPy pass.  Returns None if the heuristic has no vectorized form.
+    """
+    if heuristic not in vectorized_heuristics:
+        return None
+    dx = np.abs(np.arange(width, dtype=float) - goal[0])[:, np.newaxis]
+    dy = np.abs(np.arange(height, dtype=float) - goal[1])[np.newaxis, :]
+    return vectorized_heuristics[heuristic](dx, dy)
+
+
 def reconstruct_path(came_from, current_node):
     """
     Takes a dictionary with the path in it and follows it to the root.
     """
-    if came_from[current_node]:
-        p = reconstruct_path(came_from, came_from[current_node])
-        p.append(current_node)
-        return p
+    path = []
+    while current_node is not None:
+        path.append(current_node)
+        current_node = came_from[current_node]
+    path.reverse()
+    return path
+
+
+def extract_path(parent, end, height, tail=None):
+    """
+    Follows a flat parent array from end back to the root and returns the
+    path as an (N, 2) int array of x, y.
+
+    parent = parent[i] is the flat index (x * height + y) of the cell that
+             cell i was reached from, -1 at the root.
+    tail   = If given, only the last tail cells of the path are walked and
+             returned, e.g. for streaming the next part to a controller.
+    """
+    if tail is None:
+        # Measure the path first so it can be filled in without appending
+        length = 0
+        index = end
+        while index != -1:
+            length += 1
+            index = parent[index]
     else:
-        return [current_node]
+        length = tail
+    indices = np.empty(length, dtype=np.int64)
+    index = end
+    i = length
+    while index != -1 and i > 0:
+        i -= 1
+        indices[i] = index
+        index = parent[index]
+    return np.column_stack(np.divmod(indices[i:], height))
 
 
 if __name__ == '__main__':
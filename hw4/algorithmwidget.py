@@ -88,7 +88,9 @@ class AlgorithmWidget(QtGui.QGroupBox):
             if self.step_event.is_set():
                 if not self.stepping:
                     self.toggle_running_button_state.emit(False)
-                result = self.step_solution()
+                # One coalesced costmap notification per step, not per cell
+                with self.costmap.batch():
+                    result = self.step_solution()
                 if not self.stepping:
                     self.toggle_running_button_state.emit(True)
                 if not result:
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import time
+import numpy as np
+
+from a_star import AStar, dist_between
+from priorityqueue import IndexedPriorityQueue
+
+
+class AnytimeAStar(AStar):
+    """
+    AnytimeAStar is Anytime Repairing A* (Likhachev, Gordon and Thrun).
+
+    It starts as weighted A*, with the heuristic inflated by epsilon, which
+    finds a path quickly that costs at most epsilon times the optimal one.
+    Each time a path is found epsilon is lowered and the search is repaired
+    rather than restarted, until the path is optimal or the caller runs out
+    of time.  self.path is always the best path found so far and self.bound
+    is the proven suboptimality bound of it.
+    """
+    def __init__(self, field, start, goal, heuristic_cost_estimate,
+                 epsilon=3.0, epsilon_step=0.5):
+        """
+        Creates a new AnytimeAStar instance.
+
+        epsilon      = The heuristic inflation of the first search.
+        epsilon_step = How much epsilon is lowered after each path is found.
+        """
+        AStar.__init__(self, field, start, goal, heuristic_cost_estimate)
+        self.epsilon = float(epsilon)
+        self.epsilon_step = epsilon_step
+
+        self.g_score.fill(np.inf)
+        self.g_score[start] = 0
+        # Cells whose g-score improved after they were closed
+        self.incons = set()
+        self.openset = IndexedPriorityQueue()
+        self.openset.push(start, self.fvalue(start))
+
+        # Suboptimality bound of self.path, infinite until one is found
+        self.bound = np.inf
+        # True once the path is optimal or there is no path
+        self.done = False
+
+    def heuristic(self, cell):
+        if not self.h_precomputed:
+            self.h_score[cell] = self.heuristic_cost_estimate(self.field, cell,
+                                                              self.goal)
+        return self.h_score[cell]
+
+    def fvalue(self, cell):
+        return self.g_score[cell] + self.epsilon * self.heuristic(cell)
+
+    def solve(self, time_budget=None, max_expansions=None):
+        """
+        Improves the path until it is optimal, time_budget seconds have
+        passed or max_expansions cells have been expanded, whichever comes
+        first.  Returns the best path found.
+        """
+        if time_budget is not None:
+            deadline = time.time() + time_budget
+        if max_expansions is not None:
+            max_expansions += self.expanded
+        while not self.done and self.step_solution():
+            if time_budget is not None and time.time() >= deadline:
+                break
+            if max_expansions is not None and self.expanded >= max_expansions:
+                break
+        return self.path
+
+    def step_solution(self):
+        """
+        Expands one cell, or publishes a path and lowers epsilon when the
+        current search is done.  Returns False once the path is optimal or
+        no path exists.
+        """
+        if self.openset and \
+           self.fvalue(self.goal) > self.openset.peek()[0]:
+            x = self.openset.pop()[1]
+            self.expanded += 1
+            self.closedset.add(x)
+            for y in self.field.get_neighbors(*x):
+                if self.field[y] == -1:
+                    continue
+                tentative_g_score = self.g_score[x] + dist_between(x, y)
+                if tentative_g_score < self.g_score[y]:
+                    self.parent[self.index(y)] = self.index(x)
+                    self.g_score[y] = tentative_g_score
+                    if y in self.closedset:
+                        self.incons.add(y)
+                    else:
+                        self.f_score[y] = self.fvalue(y)
+                        self.field[y] = self.f_score[y]
+                        self.openset.push(y, self.f_score[y])
+            self.peak_open = max(self.peak_open, len(self.openset))
+            return True
+
+        # The search for this epsilon is done
+        if self.g_score[self.goal] == np.inf:
+            self.done = True
+            return False
+        self.path = self.build_path()
+        self.bound = self.suboptimality_bound()
+        if self.bound <= 1.0:
+            self.done = True
+            self.draw_path()
+            return False
+
+        # Lower epsilon and repair the search instead of starting over
+        self.epsilon = max(1.0, self.epsilon - self.epsilon_step)
+        openset = IndexedPriorityQueue()
+        for cell in list(self.openset) + list(self.incons):
+            openset.push(cell, self.fvalue(cell))
+        self.openset = openset
+        self.incons = set()
+        self.closedset = set()
+        return True
+
+    def suboptimality_bound(self):
+        """
+        Returns how many times more than optimal the current path can cost
+        at most.
+        """
+        lower_bound = min([self.g_score[cell] + self.heuristic(cell)
+                           for cell in list(self.openset) + list(self.incons)]
+                          or [np.inf])
+        if lower_bound == np.inf or self.g_score[self.goal] == 0:
+            return 1.0
+        return max(1.0, min(self.epsilon,
+                            self.g_score[self.goal] / lower_bound))
+
+
+if __name__ == '__main__':
+    from costmap import Costmap2D
+    from obstacle import Obstacle
+    from a_star import octile
+
+    c = Costmap2D(50, 50, resolution=0.5)
+    Obstacle(10, 0, 3, 40).draw(c)
+    Obstacle(25, 10, 3, 40).draw(c)
+    Obstacle(35, 20, 10, 10).draw(c)
+
+    a_star = AnytimeAStar(c, (0, 0), (c.width - 1, c.height - 1), octile)
+    while not a_star.done:
+        start = time.time()
+        path = a_star.solve(time_budget=0.05)
+        end = time.time()
+        print 'epsilon %.1f bound %.3f, %d cells in %.3f s' \
+            % (a_star.epsilon, a_star.bound, len(path), end - start)
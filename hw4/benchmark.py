@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+"""
+Benchmarks the A* planners over generated maps.
+
+Every case is a seeded map of a given size and obstacle density with a
+start/goal pattern, solved with one planner and heuristic a few times, the
+best wall time is kept.  Each case runs in a fresh process so its peak
+memory can be measured, and results are written as JSON.  Given a baseline
+results file, cases that got slower (beyond a fractional tolerance and an
+absolute floor), expand more cells or find a different path cost are
+reported as regressions and the exit status is 1.
+
+    python benchmark.py --sizes 100 500 --output results.json
+    python benchmark.py --sizes 100 500 --baseline results.json
+"""
+
+import sys
+import json
+import time
+import random
+import resource
+import platform
+import argparse
+import multiprocessing
+
+import numpy as np
+
+from costmap import Costmap2D
+from obstacle import Obstacle
+from a_star import AStar, naive, manhattan, crow, octile
+from flat_a_star import FlatAStar
+from jump_point import JumpPointAStar
+from bidirectional_a_star import BidirectionalAStar
+
+DEFAULT_SIZES = [100, 500, 1000, 2000, 4000]
+DEFAULT_DENSITIES = [0.0, 0.1, 0.25]
+DEFAULT_PATTERNS = ['corner', 'random']
+
+HEURISTICS = {
+    'naive': naive,
+    'manhattan': manhattan,
+    'crow': crow,
+    'octile': octile,
+}
+
+PLANNERS = {
+    'astar': AStar,
+    'flat': FlatAStar,
+    'jump': JumpPointAStar,
+    'bidirectional': BidirectionalAStar,
+}
+
+# Fields that identify a case, the rest of a result is measurements.  The
+# planner is one of them, so counts are only compared within a planner.
+CASE_KEYS = ['planner', 'heuristic', 'size', 'density', 'pattern', 'seed']
+
+# Slowdowns smaller than this many seconds are timer noise, not regressions
+MIN_SLOWDOWN = 0.02
+
+
+def make_map(size, density, seed):
+    """
+    Returns a size x size costmap covered by rectangular obstacles until
+    roughly density of its cells are obstacles.
+    """
+    costmap = Costmap2D(size, size)
+    rng = random.Random(seed)
+    side = max(1, size // 20)
+    target = int(density * size * size)
+    while (costmap.data == -1).sum() < target:
+        width = rng.randint(1, 2 * side)
+        height = rng.randint(1, 2 * side)
+        Obstacle(rng.randrange(size), rng.randrange(size),
+                 width, height).draw(costmap)
+    return costmap
+
+
+def make_query(costmap, pattern, seed):
+    """Returns a (start, goal) for the pattern and clears both cells"""
+    if pattern == 'corner':
+        start = (0, 0)
+        goal = (costmap.width - 1, costmap.height - 1)
+    elif pattern == 'random':
+        rng = random.Random(seed + 1)
+        start = (rng.randrange(costmap.width), rng.randrange(costmap.height))
+        goal = (rng.randrange(costmap.width), rng.randrange(costmap.height))
+    else:
+        raise ValueError("Unknown start/goal pattern '{}'".format(pattern))
+    costmap[start] = 0
+    costmap[goal] = 0
+    return start, goal
+
+
+def path_cost(path):
+    """The length of a path of cells"""
+    if len(path) < 2:
+        return 0.0
+    steps = np.diff(np.asarray(path, dtype=float), axis=0)
+    return float(np.sqrt((steps ** 2).sum(axis=1)).sum())
+
+
+def peak_memory_kb():
+    """Peak resident memory of this process so far, in kB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(case, repeats=1):
+    """
+    Builds and solves one case repeats times, returns its result with the
+    best wall time, the first solve pays for warming up the process.
+    """
+    memory_before = peak_memory_kb()
+    wall_time = None
+    for repeat in range(repeats):
+        costmap = make_map(case['size'], case['density'], case['seed'])
+        start, goal = make_query(costmap, case['pattern'], case['seed'])
+        # Nothing is drawing the map, don't time callbacks
+        costmap.on_update = None
+
+        begin = time.time()
+        planner = PLANNERS[case['planner']](costmap, start, goal,
+                                            HEURISTICS[case['heuristic']])
+        while planner.step_solution():
+            pass
+        elapsed = time.time() - begin
+        if wall_time is None or elapsed < wall_time:
+            wall_time = elapsed
+
+    result = dict(case)
+    result.update({
+        'status': 'ok',
+        'wall_time': wall_time,
+        'expanded': planner.expanded,
+        'peak_open': planner.peak_open,
+        'peak_memory_kb': max(0, peak_memory_kb() - memory_before),
+        'path_length': len(planner.path),
+        'path_cost': path_cost(planner.path),
+    })
+    return result
+
+
+def run_isolated(case, timeout, repeats=1):
+    """Runs a case in a fresh process, so peak memory is its own"""
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        return pool.apply_async(run_case, (case, repeats)).get(timeout)
+    except multiprocessing.TimeoutError:
+        result = dict(case)
+        result['status'] = 'timeout'
+        return result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def case_key(result):
+    return tuple(result[key] for key in CASE_KEYS)
+
+
+def compare(results, baseline, tolerance, min_slowdown=MIN_SLOWDOWN):
+    """
+    Returns a list of regression messages for results against baseline.
+    A case is slower when its wall time grew by more than tolerance (a
+    fraction) and by more than min_slowdown seconds.
+    """
+    previous = dict((case_key(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None or old['status'] != 'ok':
+            continue
+        name = ' '.join('{}={}'.format(key, result[key]) for key in CASE_KEYS)
+        if result['status'] != 'ok':
+            regressions.append('{}: {}'.format(name, result['status']))
+            continue
+        allowed = max(old['wall_time'] * tolerance, min_slowdown)
+        if result['wall_time'] > old['wall_time'] + allowed:
+            regressions.append('{}: wall time {:.3f}s -> {:.3f}s'.format(
+                name, old['wall_time'], result['wall_time']))
+        if result['expanded'] > old['expanded']:
+            regressions.append('{}: expanded {} -> {}'.format(
+                name, old['expanded'], result['expanded']))
+        if abs(result['path_cost'] - old['path_cost']) > 1e-6:
+            regressions.append('{}: path cost {:.3f} -> {:.3f}'.format(
+                name, old['path_cost'], result['path_cost']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--densities', type=float, nargs='+',
+                        default=DEFAULT_DENSITIES)
+    parser.add_argument('--patterns', nargs='+', default=DEFAULT_PATTERNS,
+                        choices=DEFAULT_PATTERNS)
+    parser.add_argument('--heuristics', nargs='+',
+                        default=sorted(HEURISTICS), choices=sorted(HEURISTICS))
+    parser.add_argument('--planners', nargs='+', default=['astar'],
+                        choices=sorted(PLANNERS))
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--timeout', type=float, default=600.0,
+                        help='seconds before a case is abandoned')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='solves per case, the best wall time is kept')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline',
+                        help='results file to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fractional wall time increase')
+    parser.add_argument('--min-slowdown', type=float, default=MIN_SLOWDOWN,
+                        help='wall time increase in seconds always allowed')
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        for density in args.densities:
+            for pattern in args.patterns:
+                for seed in args.seeds:
+                    for planner in args.planners:
+                        for heuristic in args.heuristics:
+                            case = {'planner': planner,
+                                    'heuristic': heuristic, 'size': size,
+                                    'density': density, 'pattern': pattern,
+                                    'seed': seed}
+                            result = run_isolated(case, args.timeout,
+                                                  args.repeats)
+                            results.append(result)
+                            if result['status'] == 'ok':
+                                print '{planner:>13} {heuristic:>9} ' \
+                                      '{size:>5} {density:>5} {pattern:>6}' \
+                                      ' {wall_time:9.3f}s {expanded:>9} ' \
+                                      'expanded {peak_open:>8} open ' \
+                                      '{peak_memory_kb:>8} kB'.format(**result)
+                            else:
+                                print '{planner:>13} {heuristic:>9} ' \
+                                      '{size:>5} {density:>5} {pattern:>6}' \
+                                      ' {status}'.format(**result)
+
+    with open(args.output, 'w') as output:
+        json.dump({'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'machine': platform.machine(),
+                   'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                   'results': results}, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.tolerance,
+                              args.min_slowdown)
+        for regression in regressions:
+            print 'REGRESSION', regression
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from a_star import dist_between, extract_path, heuristic_grid
+from priorityqueue import IndexedPriorityQueue
+
+
+class SearchFrontier(object):
+    """
+    One direction of a bidirectional search, an A* search from root towards
+    target.
+    """
+    def __init__(self, field, root, target):
+        self.field = field
+        self.root = root
+        self.target = target
+
+        self.g_score = np.empty((field.width, field.height), dtype=float)
+        self.g_score.fill(np.inf)
+        self.h_score = None
+        self.closedset = set()
+        self.openset = IndexedPriorityQueue()
+        # Flat index (x * height + y) of the cell each cell was reached from
+        self.parent = np.empty(field.width * field.height, dtype=np.int32)
+        self.parent.fill(-1)
+
+        self.g_score[root] = 0
+
+    def heuristic(self, cell, heuristic_cost_estimate):
+        """Returns the estimated cost from cell to the target"""
+        if self.h_score is not None:
+            return self.h_score[cell]
+        return heuristic_cost_estimate(self.field, cell, self.target)
+
+    def min_f_score(self):
+        """Returns the lowest f-score in the openset"""
+        return self.openset.peek()[0]
+
+
+class BidirectionalAStar(object):
+    """
+    BidirectionalAStar runs one A* search from start towards goal and
+    another from goal towards start, and stops once they meet.
+
+    Every time a search reaches a cell the other one has already reached,
+    the path through that cell becomes a candidate.  The best candidate is
+    optimal as soon as its cost is no greater than the smallest f-score in
+    either openset, since with an admissible heuristic that f-score is a
+    lower bound on any path not found yet.  Each step expands the side with
+    the smaller openset.
+
+    It has the same solve()/step_solution() interface as AStar, and writes
+    the f-scores of both frontiers into the field.
+    """
+    def __init__(self, field, start, goal, heuristic_cost_estimate):
+        """
+        Creates a new BidirectionalAStar instance.
+        """
+        self.start = start
+        self.goal = goal
+        self.width = field.width
+        self.height = field.height
+        self.field = field
+
+        self.forward = SearchFrontier(field, start, goal)
+        self.backward = SearchFrontier(field, goal, start)
+        self.heuristic_cost_estimate = heuristic_cost_estimate
+
+        # Cost of the best path found so far and the cell where it meets
+        self.best_cost = np.inf
+        self.meeting_cell = None
+        if start == goal:
+            self.best_cost = 0.0
+            self.meeting_cell = start
+
+        # The path to the goal, an (N, 2) array of x, y
+        self.path = np.zeros((0, 2), dtype=int)
+
+        # Search statistics, over both sides
+        self.expanded = 0
+        self.peak_open = 2
+
+        for frontier in (self.forward, self.backward):
+            frontier.openset.push(frontier.root,
+                                  frontier.heuristic(frontier.root,
+                                                     heuristic_cost_estimate))
+
+    def get_heuristic_cost_estimate(self):
+        return self._heuristic_cost_estimate
+
+    def set_heuristic_cost_estimate(self, heuristic):
+        """Sets the heuristic, precomputing it towards both ends if possible"""
+        self._heuristic_cost_estimate = heuristic
+        for frontier in (self.forward, self.backward):
+            frontier.h_score = heuristic_grid(heuristic, self.width,
+                                              self.height, frontier.target)
+
+    heuristic_cost_estimate = property(get_heuristic_cost_estimate,
+                                       set_heuristic_cost_estimate)
+
+    def solve(self):
+        """
+        Solves for the path.
+        """
+        while self.step_solution():
+            pass
+        self.draw_path()
+        return True
+
+    def draw_path(self):
+        """
+        Draws the path in the field.
+        """
+        max_cell = self.field.data.max() * -1.0
+        with self.field.batch():
+            self.field[self.field.data == -1] = max_cell / 2.0
+            for (x, y) in self.path:
+                self.field[x, y] = -20
+
+    def build_path(self, tail=None):
+        """
+        Returns the path from start to goal through the meeting cell, only
+        the last tail cells of it if tail is given.
+        """
+        meeting = self.meeting_cell[0] * self.height + self.meeting_cell[1]
+        # The goal end is the root of the backward search, so that half is
+        # walked whole, and only what tail leaves of the start half
+        to_goal = extract_path(self.backward.parent, meeting,
+                               self.height)[-2::-1]
+        if tail is None:
+            path = extract_path(self.forward.parent, meeting, self.height)
+        elif tail <= len(to_goal):
+            return to_goal[len(to_goal) - tail:]
+        else:
+            path = extract_path(self.forward.parent, meeting, self.height,
+                                tail - len(to_goal))
+        return np.vstack([path, to_goal])
+
+    def finish(self):
+        """Builds and draws the path, if one was found"""
+        if self.meeting_cell is not None:
+            self.path = self.build_path()
+            self.draw_path()
+        return False
+
+    def step_solution(self):
+        """
+        Expands one cell on one side, returns True if more work is required,
+        otherwise False.
+        """
+        if not self.forward.openset or not self.backward.openset:
+            return self.finish()
+        if self.best_cost <= max(self.forward.min_f_score(),
+                                 self.backward.min_f_score()):
+            return self.finish()
+
+        if len(self.forward.openset) <= len(self.backward.openset):
+            frontier, other = self.forward, self.backward
+        else:
+            frontier, other = self.backward, self.forward
+
+        x = frontier.openset.pop()[1]
+        frontier.closedset.add(x)
+        self.expanded += 1
+        g_x = frontier.g_score[x]
+        for y in self.field.get_neighbors(*x):
+            if y in frontier.closedset:
+                continue
+            if self.field[y] == -1:
+                continue
+            tentative_g_score = g_x + dist_between(x, y)
+            if tentative_g_score >= frontier.g_score[y]:
+                continue
+            frontier.parent[y[0] * self.height + y[1]] = \
+                x[0] * self.height + x[1]
+            frontier.g_score[y] = tentative_g_score
+            f_score = tentative_g_score + \
+                frontier.heuristic(y, self.heuristic_cost_estimate)
+            self.field[y] = f_score
+            frontier.openset.push(y, f_score)
+            # Did the two searches meet here?
+            cost = tentative_g_score + other.g_score[y]
+            if cost < self.best_cost:
+                self.best_cost = cost
+                self.meeting_cell = y
+        self.peak_open = max(self.peak_open, len(self.forward.openset) +
+                                             len(self.backward.openset))
+        return True
+
+
+if __name__ == '__main__':
+    from costmap import Costmap2D
+    from obstacle import Obstacle
+    from a_star import crow
+    import time
+
+    c = Costmap2D(10, 20, resolution=0.5)
+    c.goal = (0, 0)
+    c.start = (c.width - 1, c.height - 1)
+    Obstacle(4, 3, 3, 3).draw(c)
+    Obstacle(5, 9, 3, 3).draw(c)
+    Obstacle(4, 16, 3, 3).draw(c)
+
+    a_star = BidirectionalAStar(c, c.start, c.goal, crow)
+
+    start = time.time()
+    a_star.solve()
+    end = time.time()
+
+    print 'Crow:', end - start
+    print a_star.path
+
+    try:
+        from matplotlib.pylab import imshow, show
+        imshow(a_star.field.data, interpolation='nearest')
+        show()
+    except ImportError:
+        print c
@@ -1,31 +1,120 @@
 #!/usr/bin/env python
 
-from costmap import Costmap2D
+import numpy as np
+
+from costmap import Costmap2D, NEIGHBOR_OFFSETS
 from obstacle import Obstacle
 
+def label_components(mask):
+    """
+    Returns an int32 array that numbers the 8-connected components of the
+    True cells of mask 1, 2, ..., and is 0 elsewhere.
+    """
+    width, height = mask.shape
+    stride = height + 2
+    padded = np.zeros((width + 2, stride), dtype=bool)
+    padded[1:-1, 1:-1] = mask
+    padded = padded.ravel()
+    cells = np.flatnonzero(padded)
+    # Every pair of neighboring cells, each pair once
+    a = np.concatenate([cells[padded[cells + offset]]
+                        for offset in (1, stride - 1, stride, stride + 1)])
+    b = np.concatenate([cells[padded[cells + offset]] + offset
+                        for offset in (1, stride - 1, stride, stride + 1)])
+    # Union-find where every tree points at its smallest cell, hooking the
+    # roots of the pairs still in different trees until none are
+    parent = np.arange(padded.size)
+    while len(a):
+        root_a = parent[a]
+        root_b = parent[b]
+        split = root_a != root_b
+        a, b = a[split], b[split]
+        root_a, root_b = root_a[split], root_b[split]
+        parent[np.maximum(root_a, root_b)] = np.minimum(root_a, root_b)
+        while True:
+            grandparent = parent[parent[cells]]
+            if (grandparent == parent[cells]).all():
+                break
+            parent[cells] = grandparent
+    labels = np.zeros(padded.size, dtype=np.int32)
+    roots = parent[cells]
+    labels[cells] = np.searchsorted(np.unique(roots), roots) + 1
+    return labels.reshape(width + 2, stride)[1:-1, 1:-1].copy()
+
+
 class BrushfireExpansion(object):
-    """This class represents a brushfire style expansion algorithm"""
-    def __init__(self, costmap):
+    """
+    This class represents a brushfire style expansion algorithm
+    
+    With vectorized=True each step advances the whole wave front one ring
+    using numpy index arrays, writing the ring into the costmap with a single
+    assignment (so on_update fires once per ring).  The values are the same
+    as the cell by cell expansion.
+    
+    Every reached cell is also labeled with the ignition cell (or group of
+    them) its value came from, in self.labels, so the map is partitioned
+    into the regions nearest to each source as it is expanded.
+    """
+    def __init__(self, costmap, vectorized=False):
         self.costmap = costmap
+        self.vectorized = vectorized
         
         self.ignition_cells = []
+        self.ignition_labels = []
         self.wave_front = []
         
+        # The source label of every cell, 0 where none has been reached
+        self.labels = np.zeros((costmap.width, costmap.height), dtype=np.int32)
+        self.region_index = None
+        
         self.first_step = True
     
-    def set_ignition_cells(self, ignition_cells):
-        """Sets the ignition cells, these are where the expansion should start from"""
-        if type(ignition_cells) != list: 
+    def set_ignition_cells(self, ignition_cells, labels=None):
+        """
+        Sets the ignition cells, these are where the expansion should start from
+        
+        labels gives the source label of each ignition cell, by default they
+        are labeled 1, 2, ... in order.
+        """
+        if isinstance(ignition_cells, np.ndarray) and ignition_cells.ndim == 2:
+            self.ignition_cells = ignition_cells
+        elif type(ignition_cells) != list: 
             self.ignition_cells = [ignition_cells]
         else:
             self.ignition_cells = ignition_cells
+        if labels is None:
+            labels = np.arange(1, len(self.ignition_cells) + 1)
+        self.ignition_labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        self.region_index = None
+    
+    def set_obstacle_ignition_cells(self):
+        """
+        Sets the ignition cells to the free cells around the obstacles, each
+        labeled with the obstacle it touches (see label_components)
+        """
+        data = self.costmap.data
+        components = np.pad(label_components(data == -1), 1, mode='constant')
+        touching = np.zeros(data.shape, dtype=np.int32)
+        for dx in (0, 1, 2):
+            for dy in (0, 1, 2):
+                np.maximum(touching, components[dx:dx + data.shape[0],
+                                                dy:dy + data.shape[1]],
+                           out=touching)
+        touching[data != 0] = 0
+        cells = np.argwhere(touching)
+        self.set_ignition_cells(cells, touching[cells[:, 0], cells[:, 1]])
     
     def step_solution(self):
         """This steps the solution, returns True if more work is required, otherwise False"""
+        # The regions change with every step
+        self.region_index = None
+        if self.vectorized:
+            return self.step_ring()
         if self.first_step:
             self.first_step = False
-            for cell in self.ignition_cells:
+            for cell, label in zip(self.ignition_cells, self.ignition_labels):
                 self.costmap[cell[0], cell[1]] = 1
+                self.labels[cell[0], cell[1]] = label
                 self.wave_front.append(cell)
             return True
         new_wave_front = []
@@ -34,17 +123,254 @@ class BrushfireExpansion(object):
             for neighbor in neighbors:
                 if self.costmap[neighbor[0],neighbor[1]] == 0.0:
                     self.costmap[neighbor[0],neighbor[1]] = self.costmap[cell[0], cell[1]] + 1
+                    self.labels[neighbor[0],neighbor[1]] = self.labels[cell[0], cell[1]]
                     new_wave_front.append(neighbor)
         if len(new_wave_front) == 0:
             return False
         self.wave_front = new_wave_front
         return True
     
+    def start_rings(self):
+        """Sets up the padded flat grid the vectorized expansion works on"""
+        width, height = self.costmap.width, self.costmap.height
+        self.stride = height + 2
+        # Cells that can still be reached, the padding border never can
+        self.unreached = np.zeros((width + 2, self.stride), dtype=bool)
+        self.unreached[1:-1, 1:-1] = self.costmap.data == 0
+        self.unreached = self.unreached.ravel()
+        # Scratch space for removing duplicates from a ring
+        self.claimed = np.zeros(self.unreached.size, dtype=np.int32)
+        self.neighbor_offsets = (NEIGHBOR_OFFSETS[:, 0] * self.stride +
+                                 NEIGHBOR_OFFSETS[:, 1]).astype(np.int64)
+        self.ring_value = 1
+    
+    def step_ring(self):
+        """Advances the whole wave front by one ring"""
+        if self.first_step:
+            self.first_step = False
+            self.start_rings()
+            cells = np.asarray(self.ignition_cells, dtype=np.int64)
+            cells = cells.reshape(-1, 2)
+            if len(cells) == 0:
+                return False
+            self.costmap[cells[:, 0], cells[:, 1]] = self.ring_value
+            self.labels[cells[:, 0], cells[:, 1]] = self.ignition_labels
+            self.wave_front = (cells[:, 0] + 1) * self.stride + cells[:, 1] + 1
+            self.wave_front_labels = self.ignition_labels
+            self.unreached[self.wave_front] = False
+            return True
+        ring = (self.wave_front[:, np.newaxis] + self.neighbor_offsets).ravel()
+        found = np.flatnonzero(self.unreached[ring])
+        if len(found) == 0:
+            return False
+        ring = ring[found]
+        # Keep the first occurrence of every cell, in ring order, as the
+        # cell by cell expansion would: written in reverse, the first
+        # claimer of a cell is the last write to it
+        order = np.arange(len(ring), dtype=np.int32)
+        self.claimed[ring[::-1]] = order[::-1]
+        first = self.claimed[ring] == order
+        ring = ring[first]
+        # Each cell takes the label of the wave front cell that reached it
+        ring_labels = self.wave_front_labels[found[first] //
+                                             len(self.neighbor_offsets)]
+        self.unreached[ring] = False
+        self.ring_value += 1
+        x, y = ring // self.stride - 1, ring % self.stride - 1
+        self.labels[x, y] = ring_labels
+        self.costmap[x, y] = self.ring_value
+        self.wave_front = ring
+        self.wave_front_labels = ring_labels
+        return True
+    
     def solve(self):
         """Solves the expansion completely"""
         while self.step_solution():
             pass
     
+    def build_region_index(self):
+        """Sorts the reached cells by label, once per expansion"""
+        if self.region_index is None:
+            flat = self.labels.ravel()
+            order = np.argsort(flat, kind='mergesort')
+            bounds = np.searchsorted(flat[order],
+                                     np.arange(flat.max() + 2))
+            self.region_index = (order, bounds)
+        return self.region_index
+    
+    def region(self, label):
+        """Returns the cells labeled label as an (N, 2) array"""
+        order, bounds = self.build_region_index()
+        if not 0 < label < len(bounds) - 1:
+            return np.zeros((0, 2), dtype=np.intp)
+        flat = order[bounds[label]:bounds[label + 1]]
+        return np.column_stack([flat // self.costmap.height,
+                                flat % self.costmap.height])
+    
+    def region_sizes(self):
+        """Returns how many cells have each label, indexed by label"""
+        return np.bincount(self.labels.ravel())
+    
+    def label_of(self, cell):
+        """Returns the label of the source nearest to cell, 0 if not reached"""
+        return self.labels[cell[0], cell[1]]
+    
+
+class WeightedBrushfireExpansion(object):
+    """
+    This class represents a weighted brushfire, the cost-to-go from the
+    ignition cells over cells that cost different amounts to cross.
+    
+    Moves are 8-connected and cost their length (1 or sqrt(2)) times the cost
+    of the cell moved into, quantized to integers by scale.  It is Dijkstra's
+    algorithm with a bucket (Dial) queue: a ring of max move cost + 1 buckets
+    indexed by cost, so cells are taken out in cost order without a heap, and
+    every step settles the whole bucket at once with array operations.
+    
+    costs is a float array of the costmap's shape, by default 1 plus the
+    costmap's value, -1 (obstacle) cells can never be crossed.  The costmap
+    is not written to, the cost-to-go (in map units) is kept in
+    self.cost_to_go.
+    """
+    def __init__(self, costmap, costs=None, scale=10):
+        self.costmap = costmap
+        self.scale = scale
+        if costs is None:
+            costs = 1.0 + np.maximum(costmap.data, 0)
+        
+        width, height = costmap.width, costmap.height
+        self.stride = height + 2
+        self.passable = np.zeros((width + 2, self.stride), dtype=bool)
+        self.passable[1:-1, 1:-1] = costmap.data != -1
+        self.passable = self.passable.ravel()
+        padded = np.zeros((width + 2, self.stride))
+        padded[1:-1, 1:-1] = costs
+        padded = padded.ravel()
+        # The cost of moving into every cell straight and diagonally
+        self.straight_cost = np.rint(scale * padded).astype(np.int64)
+        self.diagonal_cost = np.rint(scale * np.sqrt(2) * padded).astype(np.int64)
+        np.maximum(self.straight_cost, 1, out=self.straight_cost)
+        np.maximum(self.diagonal_cost, 1, out=self.diagonal_cost)
+        self.neighbor_offsets = (NEIGHBOR_OFFSETS[:, 0] * self.stride +
+                                 NEIGHBOR_OFFSETS[:, 1]).astype(np.int64)
+        self.diagonal = (NEIGHBOR_OFFSETS != 0).all(axis=1)
+        
+        self.unreached = np.iinfo(np.int64).max
+        self.dist = np.empty(self.passable.size, dtype=np.int64)
+        self.dist.fill(self.unreached)
+        # Every move costs at most the largest diagonal cost, so that many
+        # buckets (plus one) are never in use at the same time
+        most = self.diagonal_cost[self.passable].max() if self.passable.any() else 1
+        self.buckets = [[] for _ in range(int(most) + 1)]
+        self.pending = 0
+        self.current = 0
+        
+        self.ignition_cells = []
+        self.cost_to_go = None
+        self.descent = None
+        self.first_step = True
+    
+    def set_ignition_cells(self, ignition_cells):
+        """Sets the ignition cells, usually the goal, which cost 0 to go"""
+        cells = np.asarray(ignition_cells, dtype=np.int64).reshape(-1, 2)
+        self.ignition_cells = cells
+    
+    def push(self, cells, cost):
+        self.buckets[cost % len(self.buckets)].append(cells)
+        self.pending += 1
+    
+    def step_solution(self):
+        """Settles the cells of the next cost, returns True if more work is required, otherwise False"""
+        self.cost_to_go = None
+        self.descent = None
+        if self.first_step:
+            self.first_step = False
+            cells = (self.ignition_cells[:, 0] + 1) * self.stride + \
+                self.ignition_cells[:, 1] + 1
+            cells = cells[self.passable[cells]]
+            if len(cells) == 0:
+                return False
+            self.dist[cells] = 0
+            self.push(cells, 0)
+            return True
+        if self.pending == 0:
+            return False
+        # Find the next bucket with cells in it
+        while not self.buckets[self.current % len(self.buckets)]:
+            self.current += 1
+        bucket = self.buckets[self.current % len(self.buckets)]
+        self.pending -= len(bucket)
+        cells = np.concatenate(bucket)
+        del bucket[:]
+        # Cells that were reached more cheaply since they were pushed are stale
+        cells = np.unique(cells[self.dist[cells] == self.current])
+        
+        neighbors = cells[:, np.newaxis] + self.neighbor_offsets
+        costs = np.where(self.diagonal, self.diagonal_cost[neighbors],
+                         self.straight_cost[neighbors]) + self.current
+        neighbors, costs = neighbors.ravel(), costs.ravel()
+        cheaper = self.passable[neighbors] & (costs < self.dist[neighbors])
+        neighbors, costs = neighbors[cheaper], costs[cheaper]
+        # Keep the cheapest way to each neighbor
+        order = np.lexsort((costs, neighbors))
+        neighbors, costs = neighbors[order], costs[order]
+        first = np.ones(len(neighbors), dtype=bool)
+        first[1:] = neighbors[1:] != neighbors[:-1]
+        neighbors, costs = neighbors[first], costs[first]
+        self.dist[neighbors] = costs
+        order = np.argsort(costs, kind='mergesort')
+        neighbors, costs = neighbors[order], costs[order]
+        splits = np.flatnonzero(costs[1:] != costs[:-1]) + 1
+        for group in np.split(np.arange(len(costs)), splits):
+            if len(group):
+                self.push(neighbors[group], costs[group[0]])
+        self.current += 1
+        return self.pending > 0
+    
+    def solve(self):
+        """Solves the expansion completely, returns the cost-to-go"""
+        while self.step_solution():
+            pass
+        return self.get_cost_to_go()
+    
+    def get_cost_to_go(self):
+        """Returns the cost-to-go of every cell in map units, inf if unreached"""
+        if self.cost_to_go is None:
+            dist = self.dist.reshape(-1, self.stride)[1:-1, 1:-1]
+            unit = self.costmap.resolution / float(self.scale)
+            self.cost_to_go = np.where(dist == self.unreached, np.inf,
+                                       dist * unit)
+        return self.cost_to_go
+    
+    def prepare_descent(self):
+        """Precomputes the cheapest neighbor of every reached cell"""
+        cells = np.flatnonzero(self.dist != self.unreached)
+        neighbors = cells[:, np.newaxis] + self.neighbor_offsets
+        cheapest = neighbors[np.arange(len(cells)),
+                             np.argmin(self.dist[neighbors], axis=1)]
+        self.descent = np.empty(self.dist.size, dtype=np.int64)
+        self.descent.fill(-1)
+        # The ignition cells have no cheaper neighbor and lead to themselves
+        self.descent[cells] = np.where(self.dist[cheapest] < self.dist[cells],
+                                       cheapest, cells)
+    
+    def descend(self, start):
+        """
+        Returns the path from start down the cost-to-go to an ignition cell,
+        as an (N, 2) array of x, y, empty if start was not reached
+        """
+        if self.descent is None:
+            self.prepare_descent()
+        cell = (start[0] + 1) * self.stride + start[1] + 1
+        if self.descent[cell] < 0:
+            return np.zeros((0, 2), dtype=int)
+        path = [cell]
+        while self.descent[cell] != cell:
+            cell = self.descent[cell]
+            path.append(cell)
+        path = np.array(path)
+        return np.column_stack([path // self.stride - 1, path % self.stride - 1])
+    
 
 if __name__ == '__main__':
     c = Costmap2D(10,20, resolution=0.5)
@@ -54,6 +380,44 @@ if __name__ == '__main__':
     be = BrushfireExpansion(c)
     be.set_ignition_cells([(0,0)])
     be.solve()
+    
+    import time
+    big = Costmap2D(2000, 2000)
+    Obstacle(500, 0, 50, 1500).draw(big)
+    Obstacle(1000, 500, 50, 1500).draw(big)
+    be = BrushfireExpansion(big, vectorized=True)
+    be.set_ignition_cells([(0,0)])
+    start = time.time()
+    be.solve()
+    print 'Vectorized 2000x2000:', time.time() - start
+    
+    big[big.data != -1] = 0
+    be = BrushfireExpansion(big, vectorized=True)
+    be.set_obstacle_ignition_cells()
+    be.solve()
+    print 'Cells nearest to each obstacle:', be.region_sizes()[1:]
+    
+    # The regions, queried while stepping, are the same in both modes
+    regions = {}
+    for vectorized in (False, True):
+        small = Costmap2D(40, 30)
+        Obstacle(10, 5, 5, 15).draw(small)
+        Obstacle(25, 10, 5, 15).draw(small)
+        step = BrushfireExpansion(small, vectorized=vectorized)
+        step.set_obstacle_ignition_cells()
+        regions[vectorized] = []
+        while step.step_solution():
+            regions[vectorized].append([step.region(label).tolist()
+                                        for label in (1, 2)])
+    print 'Regions match while stepping:', regions[False] == regions[True]
+    
+    big[big.data != -1] = 0
+    wb = WeightedBrushfireExpansion(big)
+    wb.set_ignition_cells([(big.width - 1, big.height - 1)])
+    start = time.time()
+    wb.solve()
+    print 'Weighted 2000x2000:', time.time() - start
+    print 'Path down from (0, 0):', len(wb.descend((0, 0))), 'cells'
     try:
         from matplotlib.pylab import imshow, show
         imshow(c.data.T, interpolation='nearest')
@@ -1,6 +1,29 @@
 #!/usr/bin/env python
+from contextlib import contextmanager
+
 import numpy as np
 
+# The (dx, dy) of the neighbors of a cell, in the order of get_neighbors and
+# get_cardinals
+NEIGHBOR_OFFSETS = np.array([(dx, dy) for dy in (-1, 0, 1)
+                             for dx in (-1, 0, 1) if dx or dy], dtype=np.intp)
+CARDINAL_OFFSETS = np.array([(1, 0), (0, 1), (-1, 0), (0, -1)], dtype=np.intp)
+
+
+def border_masks(offsets):
+    """
+    Returns a (16, K) table of which of the K offsets stay on the map, for
+    every border code: bit 0 set on the first column (x == 0), bit 1 on the
+    last, bit 2 on the first row (y == 0) and bit 3 on the last.
+    """
+    codes = np.arange(16)[:, np.newaxis]
+    dx, dy = offsets[:, 0], offsets[:, 1]
+    return ~(((codes & 1) != 0) & (dx < 0) | ((codes & 2) != 0) & (dx > 0) |
+             ((codes & 4) != 0) & (dy < 0) | ((codes & 8) != 0) & (dy > 0))
+
+NEIGHBOR_MASKS = border_masks(NEIGHBOR_OFFSETS)
+CARDINAL_MASKS = border_masks(CARDINAL_OFFSETS)
+
 
 class Costmap2D(object):
     """
@@ -24,9 +47,20 @@ class Costmap2D(object):
         self.dtype = dtype
         self.data = np.zeros(self.width * self.height, dtype=dtype)
         self.data = self.data.reshape(self.width, self.height)
+        self.init_notifications()
 
+    def init_notifications(self):
+        """
+        Sets up on_update and batch(), every costmap's constructor calls it,
+        including the ones that keep their cells somewhere other than data.
+        """
         self.on_update = None
 
+        # Nesting depth of batch(), and the (x0, x1, y0, y1) bounding box,
+        # ends exclusive, of the cells written in it, None if there are none
+        self.batch_depth = 0
+        self.dirty = None
+
     def __repr__(self):
         return self.__str__()
 
@@ -41,28 +75,143 @@ class Costmap2D(object):
 
     def __setitem__(self, key, val):
         self.data[key] = val
-        if self.on_update != None:
+        if self.batch_depth:
+            self.mark_dirty(self.region(key))
+        elif self.on_update != None:
             self.on_update(key, val)
 
-    def get_cell_values(self, cell_coordinates, return_numpy=True):
-        """Returns a list of costmap cell values given a list of coordinates"""
-        if type(cell_coordinates) in [list, set] and len(cell_coordinates) > 0:
-            if return_numpy:
-                cell_values = np.zeros(len(cell_coordinates), dtype=self.dtype)
-                count = 0
+    def region(self, key):
+        """
+        Returns the (x0, x1, y0, y1) bounding box, ends exclusive, of the
+        cells an index into data selects, or None if it selects none.
+        """
+        if isinstance(key, np.ndarray) and key.dtype == bool and key.ndim == 2:
+            key = np.nonzero(key)
+        if type(key) != tuple:
+            key = (key,)
+        key = key + (slice(None),) * (2 - len(key))
+        bounds = []
+        for k, n in zip(key, (self.width, self.height)):
+            if isinstance(k, (int, long, np.integer)):
+                k = k + n if k < 0 else k
+                bounds.extend((int(k), int(k) + 1))
+            elif isinstance(k, slice):
+                indices = xrange(*k.indices(n))
+                if len(indices) == 0:
+                    return None
+                bounds.extend((min(indices[0], indices[-1]),
+                               max(indices[0], indices[-1]) + 1))
             else:
-                cell_values = []
-            for cell_coord in cell_coordinates:
-                x, y = cell_coord
-                cell_value = self.data[x, y]
-                if return_numpy:
-                    cell_values[count] = cell_value
-                    count += 1
-                else:
-                    cell_values.append(cell_value)
+                k = np.asarray(k)
+                if k.dtype == bool:
+                    k = np.flatnonzero(k)
+                if k.size == 0:
+                    return None
+                k = np.where(k < 0, k + n, k)
+                bounds.extend((int(k.min()), int(k.max()) + 1))
+        return tuple(bounds)
+
+    def mark_dirty(self, region):
+        """Grows the dirty bounding box to cover region"""
+        if region is None:
+            return
+        if self.dirty is None:
+            self.dirty = region
         else:
-            print cell_coordinates
-        return cell_values
+            self.dirty = (min(self.dirty[0], region[0]),
+                          max(self.dirty[1], region[1]),
+                          min(self.dirty[2], region[2]),
+                          max(self.dirty[3], region[3]))
+
+    @contextmanager
+    def batch(self):
+        """
+        Context in which writes go straight to data and on_update is not
+        called, instead the bounding box of the cells written is kept, and
+        when the outermost batch ends on_update is called once with that
+        region as a pair of slices (and its values).  Listeners get the
+        changed region, not one call per cell.
+        """
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                self.commit()
+
+    def commit(self):
+        """Notifies on_update of the dirty region, if any, and clears it"""
+        region, self.dirty = self.dirty, None
+        if region is not None and self.on_update != None:
+            key = (slice(region[0], region[1]), slice(region[2], region[3]))
+            self.on_update(key, self.data[key])
+
+    def to_flat(self, cells):
+        """
+        Returns the flat indices (x * height + y) of cells, a list of x, y
+        or an (N, 2) array, or of a 1D array of flat indices (returned as
+        they are).
+        """
+        if not isinstance(cells, np.ndarray):
+            cells = np.asarray(cells, dtype=np.intp).reshape(-1, 2)
+        cells = cells.astype(np.intp, copy=False)
+        if cells.ndim == 2:
+            return cells[:, 0] * self.height + cells[:, 1]
+        return cells.reshape(-1)
+
+    def to_cells(self, indices):
+        """Returns the (N, 2) x, y of flat indices"""
+        indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+        return np.column_stack((indices // self.height, indices % self.height))
+
+    def get_cell_values(self, cell_coordinates, return_numpy=True):
+        """
+        Returns the values of cells, given as a list, set or (N, 2) array of
+        x, y, or an array of flat indices.
+        """
+        if type(cell_coordinates) == set:
+            cell_coordinates = list(cell_coordinates)
+        if len(cell_coordinates) == 0:
+            cell_values = np.zeros(0, dtype=self.dtype)
+        else:
+            indices = self.to_flat(cell_coordinates)
+            cell_values = self[indices // self.height, indices % self.height]
+        if return_numpy:
+            return cell_values
+        return list(cell_values)
+
+    def get_neighbor_indices(self, cells, cardinal=False):
+        """
+        Returns the flat indices of the neighbors of cells (see to_flat), as
+        an (N, 8) array in the order of get_neighbors, or (N, 4) in the order
+        of get_cardinals, and a bool array of the same shape that is False
+        where a neighbor is off the map.  Those entries are -1.
+        """
+        indices = self.to_flat(cells)
+        offsets, masks = (CARDINAL_OFFSETS, CARDINAL_MASKS) if cardinal \
+            else (NEIGHBOR_OFFSETS, NEIGHBOR_MASKS)
+        x, y = indices // self.height, indices % self.height
+        codes = (x == 0) | (x == self.width - 1) << 1 | \
+            (y == 0) << 2 | (y == self.height - 1) << 3
+        valid = masks[codes]
+        neighbors = indices[:, np.newaxis] + \
+            (offsets[:, 0] * self.height + offsets[:, 1])
+        neighbors[~valid] = -1
+        return neighbors, valid
+
+    def get_neighbor_values(self, cells, cardinal=False):
+        """
+        Returns the values of the neighbors of cells, shaped and ordered as
+        get_neighbor_indices, with -1 (an obstacle) for the ones off the map,
+        and the bool array of the ones on it.
+        """
+        neighbors, valid = self.get_neighbor_indices(cells, cardinal)
+        values = np.empty(neighbors.shape, dtype=self.dtype)
+        values.fill(-1)
+        on_map = neighbors[valid]
+        values[valid] = self[on_map // self.height, on_map % self.height]
+        return values, valid
 
     def get_neighbors(self, x, y):
         """Returns the 8 directional neighbors of the cell at the given x, y"""
@@ -97,6 +246,7 @@ if __name__ == '__main__':
     print type(c.get_cell_values([(1, 1), (1, 2), (1, 3), (1, 4)]))
     print c.get_cell_values([(1, 1), (1, 2), (1, 3), (1, 4)],\
                             return_numpy=False)
+    print c.get_cell_values([])
     print type(c.get_cell_values([(1, 1), (1, 2), (1, 3), (1, 4)],\
                                  return_numpy=False))
     print c
@@ -106,3 +256,14 @@ if __name__ == '__main__':
     print set(c.get_cardinals(0, 0)) == set([(0, 1), (1, 0)])
     print set(c.get_cardinals(5, 5)) == set([(6, 5), (5, 6), (4, 5), (5, 4)])
     print set(c.get_cardinals(9, 19)) == set([(8, 19), (9, 18)])
+    neighbors, valid = c.get_neighbor_indices([(0, 0), (5, 5), (9, 19)])
+    print [map(tuple, c.to_cells(n[v])) == c.get_neighbors(*cell)
+           for n, v, cell in zip(neighbors, valid, [(0, 0), (5, 5), (9, 19)])]
+    print c.get_neighbor_values([(1, 0)], cardinal=True)
+    def print_update(key, val):
+        print 'Updated', c.region(key)
+    c.on_update = print_update
+    with c.batch():
+        c[2, 3] = 5
+        c[7, 10] = 6
+        c[c.data == 6] = 7
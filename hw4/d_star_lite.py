@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from a_star import dist_between
+from priorityqueue import IndexedPriorityQueue
+
+
+class DStarLite(object):
+    """
+    DStarLite is an incremental planner (Koenig and Likhachev's D* Lite).
+
+    It searches backwards from the goal, so the g-scores it keeps are
+    costs-to-go and stay valid while the robot moves towards the goal.  It
+    subscribes to the field's on_update callback (calling whatever callback
+    was there before), and when a cell becomes or stops being an obstacle
+    only the part of the search tree that depended on that cell is repaired
+    on the next replan().
+
+    Unlike AStar it never writes into the field, since its own writes would
+    show up as map changes.
+    """
+    def __init__(self, field, start, goal, heuristic_cost_estimate):
+        """
+        Creates a new DStarLite instance.
+
+        heuristic_cost_estimate = An admissible, consistent heuristic, it is
+                                  called as h(field, start, cell).
+        """
+        self.start = start
+        self.goal = goal
+        self.width = field.width
+        self.height = field.height
+        self.field = field
+        self.heuristic_cost_estimate = heuristic_cost_estimate
+
+        self.blocked = field.data == -1
+        # Cells whose obstacle state changed since the last replan
+        self.changed_cells = set()
+
+        self.g_score = np.empty((self.width, self.height), dtype=float)
+        self.g_score.fill(np.inf)
+        self.rhs = self.g_score.copy()
+
+        # Accumulated heuristic offset, so keys stay valid as the start moves
+        self.km = 0.0
+        self.last_start = start
+
+        self.openset = IndexedPriorityQueue()
+        self.rhs[goal] = 0
+        self.openset.push(goal, self.calculate_key(goal))
+
+        # The path to the goal
+        self.path = []
+        # Number of cells expanded, across all replans
+        self.expanded = 0
+
+        self.previous_on_update = field.on_update
+        field.on_update = self.on_field_update
+
+    def detach(self):
+        """Stops listening to the field, restoring its previous callback"""
+        self.field.on_update = self.previous_on_update
+
+    def on_field_update(self, key, val):
+        """Callback that records cells whose obstacle state changed"""
+        if self.previous_on_update != None:
+            self.previous_on_update(key, val)
+        if type(key) == tuple and len(key) == 2 and \
+           all(isinstance(k, (int, long, np.integer)) for k in key):
+            if (self.field.data[key] == -1) != self.blocked[key]:
+                self.changed_cells.add((int(key[0]), int(key[1])))
+            return
+        # Slices, masks and batches, compare the written region in one pass
+        region = self.field.region(key)
+        if region is None:
+            return
+        x0, x1, y0, y1 = region
+        changed = np.argwhere((self.field.data[x0:x1, y0:y1] == -1) !=
+                              self.blocked[x0:x1, y0:y1]) + (x0, y0)
+        self.changed_cells.update((int(x), int(y)) for x, y in changed)
+
+    def heuristic(self, cell):
+        return self.heuristic_cost_estimate(self.field, self.start, cell)
+
+    def calculate_key(self, cell):
+        # Keys are rounded so that sums which are equal on paper compare
+        # equal, otherwise a ulp of difference can end the search early
+        m = min(self.g_score[cell], self.rhs[cell])
+        return (round(m + self.heuristic(cell) + self.km, 9), round(m, 9))
+
+    def cost(self, cell0, cell1):
+        """The cost of moving between two neighboring cells"""
+        if self.blocked[cell0] or self.blocked[cell1]:
+            return np.inf
+        return dist_between(cell0, cell1)
+
+    def update_vertex(self, cell):
+        if cell != self.goal:
+            self.rhs[cell] = min([self.cost(cell, s) + self.g_score[s]
+                                  for s in self.field.get_neighbors(*cell)])
+        if cell in self.openset:
+            self.openset.remove(cell)
+        if self.g_score[cell] != self.rhs[cell]:
+            self.openset.push(cell, self.calculate_key(cell))
+
+    def move_to(self, cell):
+        """Moves the start, e.g. as the robot drives along the path"""
+        self.km += self.heuristic_cost_estimate(self.field, self.last_start,
+                                                cell)
+        self.last_start = cell
+        self.start = cell
+
+    def apply_changes(self):
+        """Repairs the edges around every cell that changed"""
+        for cell in self.changed_cells:
+            self.blocked[cell] = self.field.data[cell] == -1
+        for cell in self.changed_cells:
+            self.update_vertex(cell)
+            for neighbor in self.field.get_neighbors(*cell):
+                self.update_vertex(neighbor)
+        self.changed_cells = set()
+
+    def replan(self):
+        """
+        Applies pending map changes and repairs the search, returns the path.
+        """
+        self.apply_changes()
+        while self.step_solution():
+            pass
+        return self.path
+
+    def solve(self):
+        """
+        Solves for the path.
+        """
+        self.replan()
+        return True
+
+    def step_solution(self):
+        """
+        Processes one cell, returns True if more work is required, otherwise
+        False.
+        """
+        start = self.start
+        if not self.openset or \
+           (self.openset.peek()[0] >= self.calculate_key(start) and
+            self.rhs[start] == self.g_score[start]):
+            self.path = self.build_path()
+            return False
+
+        k_old, u = self.openset.pop()
+        self.expanded += 1
+        k_new = self.calculate_key(u)
+        if k_old < k_new:
+            self.openset.push(u, k_new)
+        elif self.g_score[u] > self.rhs[u]:
+            self.g_score[u] = self.rhs[u]
+            for s in self.field.get_neighbors(*u):
+                self.update_vertex(s)
+        else:
+            self.g_score[u] = np.inf
+            self.update_vertex(u)
+            for s in self.field.get_neighbors(*u):
+                self.update_vertex(s)
+        return True
+
+    def build_path(self):
+        """
+        Follows the cheapest cost-to-go from the start, returns [] if the goal
+        can't be reached.
+        """
+        if self.g_score[self.start] == np.inf:
+            return []
+        path = [self.start]
+        cell = self.start
+        while cell != self.goal and len(path) <= self.g_score.size:
+            cell = min(self.field.get_neighbors(*cell),
+                       key=lambda s: self.cost(cell, s) + self.g_score[s])
+            path.append(cell)
+        return path
+
+
+if __name__ == '__main__':
+    from costmap import Costmap2D
+    from obstacle import Obstacle
+    from a_star import octile
+    import time
+
+    c = Costmap2D(10, 20, resolution=0.5)
+    c.goal = (0, 0)
+    c.start = (c.width - 1, c.height - 1)
+    Obstacle(4, 3, 3, 3).draw(c)
+    Obstacle(5, 9, 3, 3).draw(c)
+    Obstacle(4, 16, 3, 3).draw(c)
+
+    d_star = DStarLite(c, c.start, c.goal, octile)
+
+    start = time.time()
+    d_star.solve()
+    end = time.time()
+    print 'Initial plan:', end - start, d_star.expanded, 'expansions'
+
+    Obstacle(0, 3, 3, 1).draw(c)
+    expanded = d_star.expanded
+    start = time.time()
+    d_star.replan()
+    end = time.time()
+    print 'Replan:', end - start, d_star.expanded - expanded, 'expansions'
+    print d_star.path
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from costmap import Costmap2D
+from obstacle import Obstacle
+from a_star import SQRT2
+
+
+def seed_mask(costmap, seeds=None, border=False):
+    """
+    Returns a bool array of the costmap's shape that is True at the seeds.
+
+    seeds can be None for the obstacle cells, a bool array or a list or
+    (N, 2) array of cells.  With border=True the mask is padded with a ring
+    of seeds around the map, so distances are also measured to the outside.
+    """
+    if seeds is None:
+        mask = costmap.data == -1
+    else:
+        seeds = np.asarray(seeds)
+        if seeds.dtype == bool and seeds.shape == costmap.data.shape:
+            mask = seeds.copy()
+        else:
+            cells = seeds.astype(np.intp).reshape(-1, 2)
+            mask = np.zeros(costmap.data.shape, dtype=bool)
+            mask[cells[:, 0], cells[:, 1]] = True
+    if border:
+        mask = np.pad(mask, 1, mode='constant', constant_values=True)
+    return mask
+
+
+def squared_distance_rows(f, return_nearest=False):
+    """
+    Returns the 1D squared Euclidean distance transform of every row of f,
+    min over i of (j - i)**2 + f[i], with the lower envelope of parabolas
+    algorithm of Felzenszwalb and Huttenlocher run on all rows at once.
+    With return_nearest=True the minimizing i of every cell is returned too.
+    """
+    rows, n = f.shape
+    # Per row, the parabolas of the lower envelope and where they start,
+    # as flat indices so every row is handled by the same array operation
+    base = np.arange(rows) * n
+    f = f.ravel()
+    v = np.zeros(rows * n, dtype=np.intp)
+    z = np.empty(rows * (n + 1))
+    zbase = np.arange(rows) * (n + 1)
+    z[zbase] = -np.inf
+    z[zbase + 1] = np.inf
+    k = np.zeros(rows, dtype=np.intp)
+    s = np.empty(rows)
+    for q in range(1, n):
+        fq = f[base + q] + q * q
+        todo = np.arange(rows)
+        while len(todo):
+            vk = v[base[todo] + k[todo]]
+            s[todo] = (fq[todo] - (f[base[todo] + vk] + vk * vk)) / \
+                (2.0 * (q - vk))
+            todo = todo[s[todo] <= z[zbase[todo] + k[todo]]]
+            k[todo] -= 1
+        k += 1
+        v[base + k] = q
+        z[zbase + k] = s
+        z[zbase + k + 1] = np.inf
+
+    d = np.empty((rows, n))
+    if return_nearest:
+        nearest = np.empty((rows, n), dtype=np.intp)
+    k[:] = 0
+    for q in range(n):
+        todo = np.arange(rows)
+        while len(todo):
+            todo = todo[z[zbase[todo] + k[todo] + 1] < q]
+            k[todo] += 1
+        vk = v[base + k]
+        d[:, q] = (q - vk) ** 2 + f[base + vk]
+        if return_nearest:
+            nearest[:, q] = vk
+    if return_nearest:
+        return d, nearest
+    return d
+
+
+def euclidean_distance(mask, return_nearest=False):
+    """
+    Exact Euclidean distance, in cells, from every cell to a True cell.
+    With return_nearest=True the flat index (x * height + y) of the True
+    cell each distance is measured to is returned too, -1 if there is none.
+    """
+    width, height = mask.shape
+    # Larger than any real squared distance on the grid, and still exact
+    far = float(width * width + height * height)
+    # Along y the nearest seed is the closer of the last one before and the
+    # first one after each cell
+    y = np.arange(height)
+    before = np.maximum.accumulate(np.where(mask, y, -2 * height), axis=1)
+    after = np.minimum.accumulate(np.where(mask, y, 3 * height)[:, ::-1],
+                                  axis=1)[:, ::-1]
+    f = np.minimum(y - before, after - y).astype(float) ** 2
+    f[~mask.any(axis=1)] = far
+    if return_nearest:
+        f, nearest_x = squared_distance_rows(f.T, return_nearest=True)
+    else:
+        f = squared_distance_rows(f.T)
+    f = f.T
+    distance = np.sqrt(f)
+    distance[f >= far] = np.inf
+    if not return_nearest:
+        return distance
+    nearest_y = np.where(y - before <= after - y, before, after)
+    nearest_x = nearest_x.T
+    nearest = nearest_x * height + nearest_y[nearest_x, y]
+    nearest[f >= far] = -1
+    return distance, nearest
+
+
+def chamfer_sweep(mask, straight, diagonal):
+    """
+    Two pass chamfer distance with the given straight and diagonal step
+    costs.  Each column of cells is relaxed from the previous one, then
+    along itself with a running minimum.
+    """
+    width, height = mask.shape
+    d = np.where(mask, 0.0, np.inf)
+    ramp = straight * np.arange(height)
+    for columns in (range(width), range(width - 1, -1, -1)):
+        previous = None
+        for x in columns:
+            c = d[x]
+            if previous is not None:
+                c = np.minimum(c, previous + straight)
+                c[1:] = np.minimum(c[1:], previous[:-1] + diagonal)
+                c[:-1] = np.minimum(c[:-1], previous[1:] + diagonal)
+            # d[y] = min(c[y], d[y - 1] + straight), then the same downwards
+            c = ramp + np.minimum.accumulate(c - ramp)
+            c = (ramp + np.minimum.accumulate(c[::-1] - ramp))[::-1]
+            d[x] = c
+            previous = c
+    return d
+
+
+def chamfer_distance(mask):
+    """Chamfer 3-4 distance, in cells, from every cell to a True cell"""
+    return chamfer_sweep(mask, 3.0, 4.0) / 3.0
+
+
+def octile_distance(mask):
+    """Octile distance, in cells, from every cell to a True cell"""
+    return chamfer_sweep(mask, 1.0, SQRT2)
+
+
+metrics = {
+    'euclidean': euclidean_distance,
+    'chamfer': chamfer_distance,
+    'octile': octile_distance,
+}
+
+
+def distance_transform(costmap, seeds=None, metric='euclidean', border=False):
+    """
+    Returns a float32 array of the distance, in map units, from every cell
+    of the costmap to the nearest seed cell (by default the obstacles).
+    Cells with no seed to measure to are inf.
+    """
+    if metric not in metrics:
+        raise ValueError("Unknown metric '{}', expected one of {}"
+                         .format(metric, sorted(metrics)))
+    distance = metrics[metric](seed_mask(costmap, seeds, border))
+    if border:
+        distance = distance[1:-1, 1:-1]
+    return (distance * costmap.resolution).astype(np.float32)
+
+
+class DistanceTransform(object):
+    """
+    This class computes a clearance layer for a costmap in one pass, as an
+    alternative to a brushfire expansion.
+
+    Unlike brushfire the costmap is not written to, the distances (in map
+    units) are kept in self.distance, so they are metric rather than hop
+    counts and do not overflow the costmap's dtype.
+    """
+    def __init__(self, costmap, metric='euclidean', border=False):
+        self.costmap = costmap
+        self.metric = metric
+        self.border = border
+
+        self.ignition_cells = None
+        self.distance = None
+
+    def set_ignition_cells(self, ignition_cells):
+        """Sets the seed cells, by default the obstacles are used"""
+        self.ignition_cells = ignition_cells
+
+    def step_solution(self):
+        """Computes the whole transform, there is never more work to do"""
+        self.solve()
+        return False
+
+    def solve(self):
+        """Computes and returns the distance layer"""
+        self.distance = distance_transform(self.costmap, self.ignition_cells,
+                                           self.metric, self.border)
+        return self.distance
+
+
+if __name__ == '__main__':
+    import time
+    c = Costmap2D(10,20, resolution=0.5)
+    Obstacle(3,3,3,3).draw(c)
+    Obstacle(5,9,3,3).draw(c)
+    Obstacle(4,16,3,3).draw(c)
+    for metric in sorted(metrics):
+        start = time.time()
+        distance = DistanceTransform(c, metric, border=True).solve()
+        end = time.time()
+        print metric, end - start
+        print distance.T.round(1)
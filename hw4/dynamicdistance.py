@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from costmap import Costmap2D
+from obstacle import Obstacle
+from distancetransform import euclidean_distance
+
+
+# Side, in cells, of the blocks the largest distance is kept for
+BLOCK = 16
+
+
+class DynamicDistanceMap(object):
+    """
+    DynamicDistanceMap keeps the Euclidean distance from every cell to the
+    nearest obstacle current as obstacles come and go.
+
+    Every cell remembers which obstacle cell it is nearest to.  Only two
+    kinds of cells can change: the ones whose nearest obstacle was removed,
+    and the ones a new obstacle can be nearer to than their current one.
+    Both are no farther from the changed cells than from their current
+    obstacle, so keeping the largest distance of every BLOCK x BLOCK block
+    bounds where they can be, and an update only looks at the blocks that
+    could hold one.  It then recomputes the exact distance transform over a
+    window around the cells found, grown until each of them is nearer to an
+    obstacle in the window than to the window's border, so no obstacle
+    outside could be nearer.  A change that reaches across most of the map
+    rebuilds it.
+
+    It subscribes to the costmap's on_update callback (calling whatever
+    callback was there before) and applies the changes on the next
+    update().
+    """
+    def __init__(self, costmap):
+        """
+        Creates a new DynamicDistanceMap, with an exact distance transform.
+        """
+        self.costmap = costmap
+        self.width = costmap.width
+        self.height = costmap.height
+
+        self.blocked = costmap.data == -1
+        # Cells whose obstacle state changed since the last update
+        self.changed_cells = set()
+
+        # Number of cells recomputed, across all updates
+        self.processed = 0
+        self.rebuild()
+
+        self.previous_on_update = costmap.on_update
+        costmap.on_update = self.on_field_update
+
+    def detach(self):
+        """Stops listening to the costmap, restoring its previous callback"""
+        self.costmap.on_update = self.previous_on_update
+
+    def on_field_update(self, key, val):
+        """Callback that records cells whose obstacle state changed"""
+        if self.previous_on_update != None:
+            self.previous_on_update(key, val)
+        if type(key) == tuple and len(key) == 2 and \
+           all(isinstance(k, (int, long, np.integer)) for k in key):
+            if (self.costmap.data[key] == -1) != self.blocked[key]:
+                self.changed_cells.add((int(key[0]), int(key[1])))
+            return
+        # Slices, masks and batches, compare the written region in one pass
+        region = self.costmap.region(key)
+        if region is None:
+            return
+        x0, x1, y0, y1 = region
+        changed = np.argwhere((self.costmap.data[x0:x1, y0:y1] == -1) !=
+                              self.blocked[x0:x1, y0:y1]) + (x0, y0)
+        self.changed_cells.update((int(x), int(y)) for x, y in changed)
+
+    def rebuild(self):
+        """Recomputes the whole map"""
+        distance, nearest = euclidean_distance(self.blocked,
+                                               return_nearest=True)
+        # Squared distance in cells to the nearest obstacle, and the flat
+        # index (x * height + y) of that obstacle, -1 if there is none
+        self.squared = np.rint(distance ** 2)
+        self.nearest = nearest
+        self.block_max = np.empty((-(-self.width // BLOCK),
+                                   -(-self.height // BLOCK)))
+        self.update_block_max(0, self.width, 0, self.height)
+        self.processed += self.width * self.height
+
+    def update_block_max(self, x0, x1, y0, y1):
+        """Recomputes the largest squared distance of the blocks of a window"""
+        bx0, bx1 = x0 // BLOCK, -(-x1 // BLOCK)
+        by0, by1 = y0 // BLOCK, -(-y1 // BLOCK)
+        squared = self.squared[bx0 * BLOCK:bx1 * BLOCK,
+                               by0 * BLOCK:by1 * BLOCK]
+        squared = np.maximum.reduceat(squared, np.arange(0, squared.shape[0],
+                                                         BLOCK), axis=0)
+        self.block_max[bx0:bx1, by0:by1] = np.maximum.reduceat(
+            squared, np.arange(0, squared.shape[1], BLOCK), axis=1)
+
+    def window_distance(self, x0, x1, y0, y1):
+        """
+        Returns the squared distance and the nearest obstacle (flat index of
+        the map) of the cells of a window, measured to the obstacles in it,
+        and the squared distance from each cell to the nearest cell outside
+        the window (inf along the map's edges).
+        """
+        distance, nearest = euclidean_distance(self.blocked[x0:x1, y0:y1],
+                                               return_nearest=True)
+        nx, ny = divmod(nearest, y1 - y0)
+        nearest = np.where(nearest >= 0, (nx + x0) * self.height + ny + y0, -1)
+        border = np.empty((x1 - x0, y1 - y0))
+        border.fill(np.inf)
+        xs = np.arange(x1 - x0)[:, np.newaxis]
+        ys = np.arange(y1 - y0)[np.newaxis, :]
+        for edge, gap in ((x0 > 0, xs + 1), (x1 < self.width, x1 - x0 - xs),
+                          (y0 > 0, ys + 1), (y1 < self.height, y1 - y0 - ys)):
+            if edge:
+                np.minimum(border, gap, out=border)
+        return np.rint(distance ** 2), nearest, border ** 2
+
+    def candidate_window(self, x0, x1, y0, y1):
+        """
+        Returns the x0, x1, y0, y1 of the blocks whose largest squared
+        distance reaches the box x0, x1, y0, y1 (ends exclusive), the only
+        blocks a change in that box can affect.
+        """
+        starts = np.arange(0, self.width, BLOCK)
+        dx = np.maximum(np.maximum(starts - (x1 - 1), 0),
+                        x0 - np.minimum(starts + BLOCK, self.width) + 1)
+        starts = np.arange(0, self.height, BLOCK)
+        dy = np.maximum(np.maximum(starts - (y1 - 1), 0),
+                        y0 - np.minimum(starts + BLOCK, self.height) + 1)
+        bx, by = np.nonzero(dx[:, np.newaxis] ** 2 + dy[np.newaxis, :] ** 2
+                            <= self.block_max)
+        return (bx.min() * BLOCK, min((bx.max() + 1) * BLOCK, self.width),
+                by.min() * BLOCK, min((by.max() + 1) * BLOCK, self.height))
+
+    def update(self):
+        """Applies the pending obstacle changes"""
+        if not self.changed_cells:
+            return
+        cells = np.array(sorted(self.changed_cells), dtype=np.intp)
+        self.changed_cells = set()
+        x, y = cells[:, 0], cells[:, 1]
+        self.blocked[x, y] = self.costmap.data[x, y] == -1
+        added = self.blocked[x, y]
+
+        # The blocks of the changed cells always qualify, so this is never
+        # empty
+        x0, x1, y0, y1 = self.candidate_window(x.min(), x.max() + 1,
+                                               y.min(), y.max() + 1)
+        candidates = np.s_[x0:x1, y0:y1]
+        # Cells measured to a removed obstacle
+        affected = np.in1d(self.nearest[candidates],
+                           (x * self.height + y)[~added])
+        affected = affected.reshape(x1 - x0, y1 - y0)
+        if added.any():
+            # Cells farther from their obstacle than from the box around the
+            # added ones may have a new nearest obstacle
+            xs, ys = np.arange(x0, x1), np.arange(y0, y1)
+            dx = np.maximum(np.maximum(x[added].min() - xs, 0),
+                            xs - x[added].max())
+            dy = np.maximum(np.maximum(y[added].min() - ys, 0),
+                            ys - y[added].max())
+            affected |= (dx[:, np.newaxis] ** 2 + dy[np.newaxis, :] ** 2) < \
+                self.squared[candidates]
+        ax, ay = np.nonzero(affected)
+        if len(ax) == 0:
+            return
+        current = self.squared[candidates][ax, ay]
+        ax += x0
+        ay += y0
+        x0, x1 = ax.min(), ax.max() + 1
+        y0, y1 = ay.min(), ay.max() + 1
+
+        # Grow the window until the new distances of the affected cells are
+        # nearer than anything outside it, so they are exact.  The cells a
+        # new obstacle is nearer to get no farther than they are now, so
+        # that is where to start.
+        current = current[np.isfinite(current)]
+        grow = int(np.ceil(np.sqrt(current.max() if len(current) else 0))) + 1
+        while True:
+            wx0, wx1 = max(0, x0 - grow), min(self.width, x1 + grow)
+            wy0, wy1 = max(0, y0 - grow), min(self.height, y1 + grow)
+            # A window over most of the map costs as much as all of it
+            if (wx1 - wx0) * (wy1 - wy0) * 2 > self.width * self.height:
+                return self.rebuild()
+            squared, nearest, border = self.window_distance(wx0, wx1, wy0, wy1)
+            window = (ax - wx0, ay - wy0)
+            if (squared[window] <= border[window]).all():
+                break
+            grow *= 2
+        self.processed += squared.size
+        self.squared[ax, ay] = squared[window]
+        self.nearest[ax, ay] = nearest[window]
+        self.update_block_max(x0, x1, y0, y1)
+
+    def distance(self):
+        """
+        Returns the current distance, in map units, from every cell to the
+        nearest obstacle as a float32 array, inf where there is none.
+        """
+        self.update()
+        return (np.sqrt(self.squared) * self.costmap.resolution) \
+            .astype(np.float32)
+
+    def clearance(self, cell):
+        """Returns the current distance from cell to the nearest obstacle"""
+        self.update()
+        return np.sqrt(self.squared[cell]) * self.costmap.resolution
+
+
+if __name__ == '__main__':
+    import time
+
+    c = Costmap2D(500, 500)
+    Obstacle(100, 0, 10, 400).draw(c)
+    Obstacle(300, 100, 10, 400).draw(c)
+
+    start = time.time()
+    dm = DynamicDistanceMap(c)
+    end = time.time()
+    print 'Build:', end - start
+
+    Obstacle(200, 200, 5, 5).draw(c)
+    start = time.time()
+    dm.update()
+    end = time.time()
+    print 'Add an obstacle:', end - start, dm.processed, 'cells'
+
+    Obstacle(200, 200, 5, 5).draw(c, 0)
+    start = time.time()
+    dm.update()
+    end = time.time()
+    print 'Remove it again:', end - start, dm.processed, 'cells'
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+import math
+import heapq
+import numpy as np
+
+from costmap import NEIGHBOR_OFFSETS
+from a_star import extract_path, heuristic_grid
+
+
+class FlatAStar(object):
+    """
+    FlatAStar is an alternative A* engine that works on flattened cell
+    indices instead of (x, y) tuples.
+
+    The field is copied into a grid padded with a one cell border, so every
+    cell has 8 neighbors at fixed index offsets and no bounds checks are
+    needed.  Obstacles and the border start out closed, which means a single
+    lookup in the closed array rejects all of them.  The search state is a
+    float64 g-score array, an int32 parent array and a boolean closed array,
+    13 bytes per cell regardless of how much of the map gets searched, plus a
+    float64 heuristic array when the heuristic has a vectorized form.
+
+    It has the same solve()/step_solution() interface as AStar.
+    """
+    def __init__(self, field, start, goal, heuristic_cost_estimate,
+                 show_scores=True):
+        """
+        Creates a new FlatAStar instance.
+
+        show_scores = If True, the f-score of every discovered cell is written
+                      into the field so it can be watched from the GUI.
+        """
+        self.start = start
+        self.goal = goal
+        self.width = field.width
+        self.height = field.height
+        self.field = field
+        self.show_scores = show_scores
+
+        # Row length of the padded grid
+        self.stride = self.height + 2
+        self.size = size = (self.width + 2) * self.stride
+        self.heuristic_cost_estimate = heuristic_cost_estimate
+
+        closed = np.ones((self.width + 2, self.stride), dtype=bool)
+        closed[1:-1, 1:-1] = field.data == -1
+        self.closed = closed.reshape(size)
+        self.g_score = np.empty(size, dtype=np.float64)
+        self.g_score.fill(np.inf)
+        self.parent = np.empty(size, dtype=np.int32)
+        self.parent.fill(-1)
+
+        # Same neighbor order as Costmap2D.get_neighbors
+        self.neighbor_offsets = [(int(dx) * self.stride + int(dy),
+                                  math.sqrt(dx * dx + dy * dy))
+                                 for dx, dy in NEIGHBOR_OFFSETS]
+
+        # Flat view of the field for writing scores without callbacks
+        self.field_data = field.data.reshape(self.width * self.height)
+
+        self.start_index = self.to_index(start)
+        self.goal_index = self.to_index(goal)
+
+        # The path to the goal, an (N, 2) array of x, y
+        self.path = np.zeros((0, 2), dtype=int)
+
+        # Stale entries are left in the heap and skipped once their cell is
+        # closed, which is cheaper than a decrease-key in pure Python.
+        self.g_score[self.start_index] = 0
+        self.openset = [(self.heuristic_cost_estimate(field, start, goal),
+                         self.start_index)]
+
+        # Search statistics, peak_open counts stale heap entries too
+        self.expanded = 0
+        self.peak_open = 1
+
+    def get_heuristic_cost_estimate(self):
+        return self._heuristic_cost_estimate
+
+    def set_heuristic_cost_estimate(self, heuristic):
+        """Sets the heuristic, precomputing it over the padded grid"""
+        self._heuristic_cost_estimate = heuristic
+        grid = heuristic_grid(heuristic, self.width, self.height, self.goal)
+        if grid is None:
+            self.h_score = None
+        else:
+            h_score = np.zeros((self.width + 2, self.stride), dtype=np.float64)
+            h_score[1:-1, 1:-1] = grid
+            self.h_score = h_score.reshape(self.size)
+
+    heuristic_cost_estimate = property(get_heuristic_cost_estimate,
+                                       set_heuristic_cost_estimate)
+
+    def to_index(self, cell):
+        """Returns the padded flat index of the cell at the given x, y"""
+        return (int(cell[0]) + 1) * self.stride + int(cell[1]) + 1
+
+    def to_cell(self, index):
+        """Returns the x, y of the given padded flat index"""
+        x, y = divmod(index, self.stride)
+        return (x - 1, y - 1)
+
+    def solve(self):
+        """
+        Solves for the path.
+        """
+        while self.step_solution():
+            pass
+        self.draw_path()
+        return True
+
+    def draw_path(self):
+        """
+        Draws the path in the field.
+        """
+        max_cell = self.field.data.max() * -1.0
+        with self.field.batch():
+            self.field[self.field.data == -1] = max_cell / 2.0
+            for (x, y) in self.path:
+                self.field[x, y] = -20
+
+    def build_path(self, tail=None):
+        """
+        Follows the parent array from the goal back to the start, returns the
+        last tail cells only if tail is given.
+        """
+        return extract_path(self.parent, self.goal_index, self.stride,
+                            tail) - 1
+
+    def step_solution(self):
+        """
+        Expands the lowest scoring cell, returns True if more work is required,
+        otherwise False.
+        """
+        openset = self.openset
+        closed = self.closed
+        g_score = self.g_score
+        parent = self.parent
+        h_score = self.h_score
+        # Find the lowest scoring cell in the openset, skipping stale entries
+        while True:
+            try:
+                f, x = heapq.heappop(openset)
+            except IndexError:
+                return False
+            if not closed[x]:
+                break
+        # The goal is counted when it is popped, as AStar does
+        self.expanded += 1
+
+        if x == self.goal_index:
+            self.path = self.build_path()
+            self.draw_path()
+            return False
+
+        closed[x] = True
+        g_x = g_score[x]
+        for offset, cost in self.neighbor_offsets:
+            y = x + offset
+            if closed[y]:
+                continue
+            tentative_g_score = g_x + cost
+            if tentative_g_score < g_score[y]:
+                parent[y] = x
+                g_score[y] = tentative_g_score
+                if h_score is not None:
+                    f = tentative_g_score + h_score[y]
+                else:
+                    f = tentative_g_score + self.heuristic_cost_estimate(
+                            self.field, self.to_cell(y), self.goal)
+                heapq.heappush(openset, (f, y))
+                if self.show_scores:
+                    # Padded index to field index
+                    self.field_data[y - self.stride - 1 -
+                                    2 * (y // self.stride - 1)] = f
+        self.peak_open = max(self.peak_open, len(openset))
+        if self.show_scores and self.field.on_update != None:
+            self.field.on_update(self.to_cell(x), g_x)
+        return True
+
+
+if __name__ == '__main__':
+    from costmap import Costmap2D
+    from obstacle import Obstacle
+    from a_star import naive
+    import time
+
+    c = Costmap2D(10, 20, resolution=0.5)
+    c.goal = (0, 0)
+    c.start = (c.width - 1, c.height - 1)
+    Obstacle(4, 3, 3, 3).draw(c)
+    Obstacle(5, 9, 3, 3).draw(c)
+    Obstacle(4, 16, 3, 3).draw(c)
+
+    a_star = FlatAStar(c, c.start, c.goal, naive)
+
+    start = time.time()
+    a_star.solve()
+    end = time.time()
+
+    print 'Naive:', end - start
+    print a_star.path
+
+    try:
+        from matplotlib.pylab import imshow, show
+        imshow(a_star.field.data, interpolation='nearest')
+        show()
+    except ImportError:
+        print c
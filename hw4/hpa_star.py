@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+
+import math
+import heapq
+import numpy as np
+
+from a_star import SQRT2, dist_between, octile
+
+
+class HierarchicalPlanner(object):
+    """
+    HierarchicalPlanner is an HPA* (Botea, Mueller and Schaeffer) planner.
+
+    The field is split into square clusters of cluster_size cells.  Where a
+    run of free cells crosses the border between two clusters an entrance
+    is made, with a node on each side of the border, and the costs between
+    the nodes of each cluster are precomputed.  Diagonal crossings that no
+    run covers get transitions of their own, so every path on the grid has a
+    counterpart in the abstract graph.  A query is answered by searching
+    this abstract graph, then refining only the clusters the abstract path
+    crosses into cells.  Paths are near-optimal, not optimal.
+
+    It chains itself onto the field's on_update callback, and when cells
+    change only the clusters they are in (and the entrances and costs of
+    their neighbors) are rebuilt, on the next query.
+    """
+    def __init__(self, field, cluster_size=10):
+        """
+        Creates a new HierarchicalPlanner, building the abstract graph.
+        """
+        self.field = field
+        self.width = field.width
+        self.height = field.height
+        self.cluster_size = cluster_size
+        self.clusters_x = int(math.ceil(self.width / float(cluster_size)))
+        self.clusters_y = int(math.ceil(self.height / float(cluster_size)))
+
+        self.blocked = field.data == -1
+
+        # Entrance node cells of each cluster
+        self.nodes = {}
+        # Precomputed costs between the nodes of each cluster,
+        # {cell: {cell: cost}}
+        self.intra_edges = {}
+        # Costs to the nodes across the border, {cell: {cell: cost}}
+        self.links = {}
+        # Transitions across each border or corner,
+        # {(cluster, cluster): [(cell, cell, cost)]}
+        self.transitions = {}
+        for cluster in self.clusters():
+            self.nodes[cluster] = set()
+            self.intra_edges[cluster] = {}
+
+        self.dirty_clusters = set()
+        for border in self.borders():
+            self.build_entrances(border)
+        for cluster in self.clusters():
+            self.build_intra_edges(cluster)
+
+        # The last abstract path and refined path
+        self.abstract_path = []
+        self.path = []
+
+        self.previous_on_update = field.on_update
+        field.on_update = self.on_field_update
+
+    def detach(self):
+        """Stops listening to the field, restoring its previous callback"""
+        self.field.on_update = self.previous_on_update
+
+    def on_field_update(self, key, val):
+        """Callback that marks the clusters of changed cells dirty"""
+        if self.previous_on_update != None:
+            self.previous_on_update(key, val)
+        if type(key) == tuple and len(key) == 2 and \
+           all(isinstance(k, (int, long, np.integer)) for k in key):
+            if (self.field.data[key] == -1) != self.blocked[key]:
+                self.blocked[key] = not self.blocked[key]
+                self.dirty_clusters.add(self.cluster_of(key))
+            return
+        # Slices, masks and batches, compare the written region in one pass
+        region = self.field.region(key)
+        if region is None:
+            return
+        x0, x1, y0, y1 = region
+        changed = np.argwhere((self.field.data[x0:x1, y0:y1] == -1) !=
+                              self.blocked[x0:x1, y0:y1]) + (x0, y0)
+        for x, y in changed:
+            self.blocked[x, y] = not self.blocked[x, y]
+            self.dirty_clusters.add(self.cluster_of((x, y)))
+
+    def clusters(self):
+        """Returns every cluster as (cx, cy)"""
+        return [(cx, cy) for cx in range(self.clusters_x)
+                         for cy in range(self.clusters_y)]
+
+    def borders(self, cluster=None):
+        """
+        Returns the (cluster, cluster) pairs that share a border or a corner,
+        only those around the given cluster if there is one.
+        """
+        if cluster is None:
+            clusters = self.clusters()
+        else:
+            cx, cy = cluster
+            clusters = [(cx + dx, cy + dy) for dx in (-1, 0) for dy in (-1, 0)
+                        if cx + dx >= 0 and cy + dy >= 0]
+        borders = set()
+        for (cx, cy) in clusters:
+            right = cx + 1 < self.clusters_x
+            down = cy + 1 < self.clusters_y
+            if right:
+                borders.add(((cx, cy), (cx + 1, cy)))
+            if down:
+                borders.add(((cx, cy), (cx, cy + 1)))
+            if right and down:
+                borders.add(((cx, cy), (cx + 1, cy + 1)))
+                borders.add(((cx + 1, cy), (cx, cy + 1)))
+        if cluster is not None:
+            borders = set(border for border in borders if cluster in border)
+        return sorted(borders)
+
+    def cluster_of(self, cell):
+        return (int(cell[0]) // self.cluster_size,
+                int(cell[1]) // self.cluster_size)
+
+    def cluster_bounds(self, cluster):
+        """Returns x0, x1, y0, y1 of the cells in cluster (exclusive ends)"""
+        cx, cy = cluster
+        x0 = cx * self.cluster_size
+        y0 = cy * self.cluster_size
+        return (x0, min(x0 + self.cluster_size, self.width),
+                y0, min(y0 + self.cluster_size, self.height))
+
+    def build_entrances(self, border):
+        """Finds the places a path can cross a border and links them"""
+        for a, b, cost in self.transitions.pop(border, []):
+            del self.links[a][b]
+            del self.links[b][a]
+            for cell in (a, b):
+                if not self.links[cell]:
+                    del self.links[cell]
+                    self.nodes[self.cluster_of(cell)].discard(cell)
+
+        blocked = self.blocked
+        first, second = border
+        x0, x1, y0, y1 = self.cluster_bounds(first)
+        transitions = []
+        if first[0] != second[0] and first[1] != second[1]:
+            # The corner where four clusters meet, crossed diagonally
+            if first[0] < second[0]:
+                a, b = (x1 - 1, y1 - 1), (x1, y1)
+            else:
+                a, b = (x0, y1 - 1), (x0 - 1, y1)
+            if not blocked[a] and not blocked[b]:
+                transitions.append((a, b, SQRT2))
+        else:
+            if first[0] != second[0]:
+                # Vertical border between x1 - 1 and x1
+                pairs = [((x1 - 1, y), (x1, y)) for y in range(y0, y1)]
+            else:
+                # Horizontal border between y1 - 1 and y1
+                pairs = [((x, y1 - 1), (x, y1)) for x in range(x0, x1)]
+            free = [not blocked[a] and not blocked[b] for a, b in pairs]
+
+            run = []
+            for pair, pair_free in zip(pairs + [None], free + [False]):
+                if pair_free:
+                    run.append(pair)
+                    continue
+                if len(run) >= 6:
+                    # Long entrances get a transition at each end
+                    transitions.append(run[0] + (1.0,))
+                    transitions.append(run[-1] + (1.0,))
+                elif run:
+                    transitions.append(run[len(run) // 2] + (1.0,))
+                run = []
+
+            # Diagonal crossings between cells that are not in a run
+            for i in range(len(pairs) - 1):
+                if free[i] or free[i + 1]:
+                    continue
+                (a0, b0), (a1, b1) = pairs[i], pairs[i + 1]
+                for a, b in ((a0, b1), (a1, b0)):
+                    if not blocked[a] and not blocked[b]:
+                        transitions.append((a, b, SQRT2))
+
+        self.transitions[border] = transitions
+        for a, b, cost in transitions:
+            self.links.setdefault(a, {})[b] = cost
+            self.links.setdefault(b, {})[a] = cost
+            self.nodes[self.cluster_of(a)].add(a)
+            self.nodes[self.cluster_of(b)].add(b)
+
+    def build_intra_edges(self, cluster):
+        """Precomputes the costs between every pair of nodes in cluster"""
+        bounds = self.cluster_bounds(cluster)
+        nodes = self.nodes[cluster]
+        edges = {}
+        for node in nodes:
+            distances, _ = self.cluster_search(bounds, node, nodes)
+            edges[node] = dict((other, distances[other])
+                               for other in nodes
+                               if other != node and other in distances)
+        self.intra_edges[cluster] = edges
+
+    def cluster_search(self, bounds, source, targets):
+        """
+        Dijkstra from source that never leaves bounds and stops once all of
+        targets are reached.  Returns the distance and parent dicts.
+        """
+        x0, x1, y0, y1 = bounds
+        distances = {source: 0.0}
+        came_from = {source: None}
+        closedset = set()
+        remaining = set(targets)
+        remaining.discard(source)
+        openset = [(0.0, source)]
+        while openset and remaining:
+            d, x = heapq.heappop(openset)
+            if x in closedset:
+                continue
+            closedset.add(x)
+            remaining.discard(x)
+            for y in self.field.get_neighbors(*x):
+                if not (x0 <= y[0] < x1 and y0 <= y[1] < y1):
+                    continue
+                if y in closedset or self.blocked[y]:
+                    continue
+                tentative = d + dist_between(x, y)
+                if tentative < distances.get(y, np.inf):
+                    distances[y] = tentative
+                    came_from[y] = x
+                    heapq.heappush(openset, (tentative, y))
+        return distances, came_from
+
+    def update(self):
+        """Rebuilds the dirty clusters and their neighbors"""
+        if not self.dirty_clusters:
+            return
+        borders = set()
+        for cluster in self.dirty_clusters:
+            borders.update(self.borders(cluster))
+        rebuild = set(self.dirty_clusters)
+        for border in borders:
+            self.build_entrances(border)
+            rebuild.update(border)
+        for cluster in rebuild:
+            self.build_intra_edges(cluster)
+        self.dirty_clusters = set()
+
+    def connect(self, cell):
+        """Returns the costs from cell to the nodes of its cluster"""
+        cluster = self.cluster_of(cell)
+        nodes = self.nodes[cluster]
+        distances, _ = self.cluster_search(self.cluster_bounds(cluster), cell,
+                                           nodes)
+        return dict((node, distances[node]) for node in nodes
+                    if node != cell and node in distances)
+
+    def abstract_search(self, start, goal):
+        """A* over the abstract graph, with start and goal inserted"""
+        start_edges = self.connect(start)
+        goal_edges = self.connect(goal)
+        if self.cluster_of(start) == self.cluster_of(goal):
+            distances, _ = self.cluster_search(
+                self.cluster_bounds(self.cluster_of(start)), start, [goal])
+            if goal in distances:
+                start_edges[goal] = distances[goal]
+
+        g_score = {start: 0.0}
+        came_from = {start: None}
+        closedset = set()
+        openset = [(octile(self.field, start, goal), start)]
+        while openset:
+            f, x = heapq.heappop(openset)
+            if x in closedset:
+                continue
+            if x == goal:
+                path = [goal]
+                while came_from[path[-1]] is not None:
+                    path.append(came_from[path[-1]])
+                path.reverse()
+                return path
+            closedset.add(x)
+            if x == start:
+                neighbors = start_edges.items()
+            else:
+                neighbors = self.intra_edges[self.cluster_of(x)][x].items()
+                if x in goal_edges:
+                    neighbors.append((goal, goal_edges[x]))
+            neighbors += self.links.get(x, {}).items()
+            for y, cost in neighbors:
+                if y in closedset:
+                    continue
+                tentative = g_score[x] + cost
+                if tentative < g_score.get(y, np.inf):
+                    g_score[y] = tentative
+                    came_from[y] = x
+                    heapq.heappush(openset,
+                                   (tentative + octile(self.field, y, goal), y))
+        return []
+
+    def refine(self, abstract_path):
+        """Turns an abstract path into cells, searching one cluster at a time"""
+        path = abstract_path[:1]
+        for a, b in zip(abstract_path, abstract_path[1:]):
+            if b in self.links.get(a, ()):
+                path.append(b)
+                continue
+            _, came_from = self.cluster_search(
+                self.cluster_bounds(self.cluster_of(a)), a, [b])
+            segment = [b]
+            while segment[-1] != a:
+                segment.append(came_from[segment[-1]])
+            segment.reverse()
+            path.extend(segment[1:])
+        return path
+
+    def plan(self, start, goal):
+        """
+        Returns a path from start to goal as a list of cells, or [] if there
+        is none.
+        """
+        self.update()
+        if self.blocked[start] or self.blocked[goal]:
+            self.abstract_path = []
+            self.path = []
+        elif start == goal:
+            self.abstract_path = [start]
+            self.path = [start]
+        else:
+            self.abstract_path = self.abstract_search(start, goal)
+            self.path = self.refine(self.abstract_path)
+        return self.path
+
+
+if __name__ == '__main__':
+    from costmap import Costmap2D
+    from obstacle import Obstacle
+    import time
+
+    c = Costmap2D(100, 100, resolution=0.5)
+    Obstacle(20, 0, 5, 80).draw(c)
+    Obstacle(50, 20, 5, 80).draw(c)
+    Obstacle(70, 40, 20, 20).draw(c)
+
+    start = time.time()
+    hpa = HierarchicalPlanner(c, cluster_size=20)
+    end = time.time()
+    print 'Preprocessing:', end - start
+
+    start = time.time()
+    path = hpa.plan((0, 0), (c.width - 1, c.height - 1))
+    end = time.time()
+    print 'Query:', end - start, len(path), 'cells'
+
+    Obstacle(0, 85, 20, 5).draw(c)
+    start = time.time()
+    path = hpa.plan((0, 0), (c.width - 1, c.height - 1))
+    end = time.time()
+    print 'Replan:', end - start, len(path), 'cells'
@@ -14,7 +14,10 @@ from brushfire import BrushfireExpansion
 from potentialfield import PotentialField
 from voronoi import VoronoiExpansion
 from algorithmwidget import AlgorithmWidget
-from a_star import AStar, manhattan, naive, crow
+from a_star import AStar, manhattan, naive, crow, octile
+from flat_a_star import FlatAStar
+from jump_point import JumpPointAStar
+from bidirectional_a_star import BidirectionalAStar
 
 DEFAULT_WIDTH = 20
 DEFAULT_HEIGHT = 10
@@ -37,7 +40,7 @@ class PotentialAlgorithmWidget(AlgorithmWidget):
         
         self.costmap_widget = Costmap2DWidget(self.costmap, parent = self, show_goal = False,
                                                 show_start = False, show_colorbar = self.colorbar)
-        self.pf = PotentialField(self.costmap)
+        self.pf = PotentialField(self.costmap, vectorized=True)
     
     def step_solution(self):
         return self.pf.step_solution()
@@ -48,18 +51,24 @@ class PotentialAlgorithmWidget(AlgorithmWidget):
         Obstacle(9,5,3,3).draw(self.costmap)
         Obstacle(16,4,3,3).draw(self.costmap)
         
-        self.pf = PotentialField(self.costmap)
+        self.pf = PotentialField(self.costmap, vectorized=True)
         self.costmap_widget.canvas.on_map_update()
     
 
 class AStarAlgorithmWidget(AlgorithmWidget):
     def __init__(self, parent=None):
         self.heuristic = naive
+        self.planner = AStar
         AlgorithmWidget.__init__(self, "A* Algorithm", parent)
         self.combo_box = QtGui.QComboBox(parent)
-        self.combo_box.addItems(["naive", 'manhattan', 'crow'])
+        self.combo_box.addItems(["naive", 'manhattan', 'crow', 'octile'])
         self.combo_box.currentIndexChanged.connect(self.select_heuristic)
         self.buttons.append(self.combo_box)
+        self.planner_combo_box = QtGui.QComboBox(parent)
+        self.planner_combo_box.addItems(["A*", 'flat A*', 'jump point',
+                                         'bidirectional'])
+        self.planner_combo_box.currentIndexChanged.connect(self.select_planner)
+        self.buttons.append(self.planner_combo_box)
         self.pack_buttons()
 
     def select_heuristic(self, index):
@@ -69,8 +78,21 @@ class AStarAlgorithmWidget(AlgorithmWidget):
             self.heuristic = manhattan
         elif index == 2:
             self.heuristic = crow
+        elif index == 3:
+            self.heuristic = octile
         self.a_star.heuristic_cost_estimate = self.heuristic
 
+    def select_planner(self, index):
+        if index == 0:
+            self.planner = AStar
+        elif index == 1:
+            self.planner = FlatAStar
+        elif index == 2:
+            self.planner = JumpPointAStar
+        elif index == 3:
+            self.planner = BidirectionalAStar
+        self.reset_algorithm()
+
     def setup_algorithm(self):
         """Sets up the algorithm"""
         self.costmap = Costmap2D(DEFAULT_WIDTH, DEFAULT_HEIGHT,
@@ -89,10 +111,10 @@ class AStarAlgorithmWidget(AlgorithmWidget):
         self.start_coord = (floor(temp[0]+0.5), floor(temp[1]+0.5))
         temp = self.costmap_widget.canvas.goal_coord
         self.goal_coord = (floor(temp[0]+0.5), floor(temp[1]+0.5))
-        self.a_star = AStar(self.costmap,
-                            self.start_coord,
-                            self.goal_coord,
-                            self.heuristic)
+        self.a_star = self.planner(self.costmap,
+                                   self.start_coord,
+                                   self.goal_coord,
+                                   self.heuristic)
 
     def step_solution(self):
         """Steps the solution"""
@@ -122,10 +144,10 @@ class AStarAlgorithmWidget(AlgorithmWidget):
         self.start_coord = (floor(temp[0]+0.5), floor(temp[1]+0.5))
         temp = self.costmap_widget.canvas.goal_coord
         self.goal_coord = (floor(temp[0]+0.5), floor(temp[1]+0.5))
-        self.a_star = AStar(self.costmap,
-                            self.start_coord,
-                            self.goal_coord,
-                            self.heuristic)
+        self.a_star = self.planner(self.costmap,
+                                   self.start_coord,
+                                   self.goal_coord,
+                                   self.heuristic)
         self.costmap_widget.canvas.freeze = False
         self.costmap_widget.canvas.on_map_update()
 
@@ -147,7 +169,7 @@ class BrushfireAlgorithmWidget(AlgorithmWidget):
                                                 show_colorbar = self.colorbar)
         self.costmap_widget.canvas.show_start = True
         self.costmap_widget.canvas.show_goal = False
-        self.be = BrushfireExpansion(self.costmap)
+        self.be = BrushfireExpansion(self.costmap, vectorized=True)
         temp = self.costmap_widget.canvas.start_coord
         self.start_coord = (floor(temp[0]+0.5), floor(temp[1]+0.5))
         self.be.set_ignition_cells([self.start_coord])
@@ -164,7 +186,7 @@ class BrushfireAlgorithmWidget(AlgorithmWidget):
         Obstacle(9,5,3,3).draw(self.costmap)
         Obstacle(16,4,3,3).draw(self.costmap)
         
-        self.be = BrushfireExpansion(self.costmap)
+        self.be = BrushfireExpansion(self.costmap, vectorized=True)
         temp = self.costmap_widget.canvas.start_coord
         self.start_coord = (floor(temp[0]+0.5), floor(temp[1]+0.5))
         self.be.set_ignition_cells([self.start_coord])
@@ -189,11 +211,13 @@ class VoronoiAlgorithmWidget(AlgorithmWidget):
                                                 show_colorbar = self.colorbar)
         self.costmap_widget.canvas.show_start = False
         self.costmap_widget.canvas.show_goal = False
-        self.vo = VoronoiExpansion(self.costmap)
+        self.vo = VoronoiExpansion(self.costmap, vectorized=True)
 
     def step_solution(self):
         """Steps the solution"""
         result = self.vo.step_solution()
+        if not result:
+            self.vo.draw_ridges()
         self.costmap_widget.canvas.on_map_update()
 
         return result
@@ -206,7 +230,7 @@ class VoronoiAlgorithmWidget(AlgorithmWidget):
         Obstacle(9,5,3,3).draw(self.costmap)
         Obstacle(16,4,3,3).draw(self.costmap)
 
-        self.vo = VoronoiExpansion(self.costmap)
+        self.vo = VoronoiExpansion(self.costmap, vectorized=True)
         self.costmap_widget.canvas.freeze = False
         self.costmap_widget.canvas.on_map_update()
 
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from a_star import AStar, octile
+
+
+def sign(value):
+    """Returns -1, 0 or 1 depending on the sign of value"""
+    return (value > 0) - (value < 0)
+
+
+class JumpPointAStar(AStar):
+    """
+    JumpPointAStar is A* with Jump Point Search (Harabor and Grastien).
+
+    It uses the same 8-connected neighbor model as Costmap2D.get_neighbors,
+    where diagonal moves are allowed past the corners of obstacles, and it
+    assumes every traversable cell costs the same to enter.  Instead of
+    pushing every neighbor it scans along straight and diagonal lines and
+    only pushes the jump points where the path might have to turn, so open
+    regions of the map are crossed without being expanded.  The paths have
+    the same (optimal) cost as AStar's.
+    """
+    def __init__(self, field, start, goal, heuristic_cost_estimate):
+        """
+        Creates a new JumpPointAStar instance.
+        """
+        # Traversable cells, padded so every scan stops at the map border
+        self.free = np.zeros((field.width + 2, field.height + 2), dtype=bool)
+        self.free[1:-1, 1:-1] = field.data != -1
+        AStar.__init__(self, field, start, goal, heuristic_cost_estimate)
+
+    def walkable(self, x, y):
+        """Returns True if the cell at x, y is on the map and not an obstacle"""
+        return self.free[x + 1, y + 1]
+
+    def successors(self, x):
+        """
+        Yields (jump point, cost) for every jump point reachable from x.
+        """
+        for dx, dy in self.pruned_directions(x):
+            y = self.jump(x[0], x[1], dx, dy)
+            if y is None or y in self.closedset:
+                continue
+            yield y, octile(self.field, x, y)
+
+    def pruned_directions(self, cell):
+        """
+        Returns the directions worth scanning from cell, given the direction
+        it was reached from.
+        """
+        x, y = cell
+        parent = self.parent_of(cell)
+        if parent is None:
+            return [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                    if (dx or dy) and self.walkable(x + dx, y + dy)]
+        dx = sign(x - parent[0])
+        dy = sign(y - parent[1])
+        walkable = self.walkable
+        directions = []
+        if dx and dy:
+            if walkable(x, y + dy):
+                directions.append((0, dy))
+            if walkable(x + dx, y):
+                directions.append((dx, 0))
+            if walkable(x + dx, y + dy):
+                directions.append((dx, dy))
+            if not walkable(x - dx, y) and walkable(x - dx, y + dy):
+                directions.append((-dx, dy))
+            if not walkable(x, y - dy) and walkable(x + dx, y - dy):
+                directions.append((dx, -dy))
+        elif dx:
+            if walkable(x + dx, y):
+                directions.append((dx, 0))
+            if not walkable(x, y + 1) and walkable(x + dx, y + 1):
+                directions.append((dx, 1))
+            if not walkable(x, y - 1) and walkable(x + dx, y - 1):
+                directions.append((dx, -1))
+        else:
+            if walkable(x, y + dy):
+                directions.append((0, dy))
+            if not walkable(x + 1, y) and walkable(x + 1, y + dy):
+                directions.append((1, dy))
+            if not walkable(x - 1, y) and walkable(x - 1, y + dy):
+                directions.append((-1, dy))
+        return directions
+
+    def jump(self, x, y, dx, dy):
+        """
+        Scans from x, y in the direction dx, dy and returns the first jump
+        point found, or None if the scan runs into an obstacle or the border.
+        """
+        walkable = self.walkable
+        gx, gy = self.goal
+        while True:
+            x += dx
+            y += dy
+            if not walkable(x, y):
+                return None
+            if x == gx and y == gy:
+                return (x, y)
+            if dx and dy:
+                if (not walkable(x - dx, y) and walkable(x - dx, y + dy)) or \
+                   (not walkable(x, y - dy) and walkable(x + dx, y - dy)):
+                    return (x, y)
+                # A diagonal step is a jump point if either straight scan
+                # out of it finds one
+                if self.jump(x, y, dx, 0) is not None or \
+                   self.jump(x, y, 0, dy) is not None:
+                    return (x, y)
+            elif dx:
+                if (not walkable(x, y + 1) and walkable(x + dx, y + 1)) or \
+                   (not walkable(x, y - 1) and walkable(x + dx, y - 1)):
+                    return (x, y)
+            else:
+                if (not walkable(x + 1, y) and walkable(x + 1, y + dy)) or \
+                   (not walkable(x - 1, y) and walkable(x - 1, y + dy)):
+                    return (x, y)
+
+    def build_path(self, tail=None):
+        """
+        Returns the path from start to goal with the cells between
+        consecutive jump points filled in, only the last tail cells of it if
+        tail is given.
+        """
+        jump_points = AStar.build_path(self)
+        deltas = np.diff(jump_points, axis=0)
+        steps = np.abs(deltas).max(axis=1)
+        # Every cell is its jump point plus k steps towards the next one
+        origins = np.repeat(jump_points[:-1], steps, axis=0)
+        directions = np.repeat(np.sign(deltas), steps, axis=0)
+        k = np.arange(1, steps.sum() + 1) - np.repeat(np.cumsum(steps) - steps,
+                                                      steps)
+        path = np.vstack([jump_points[:1],
+                          origins + directions * k[:, np.newaxis]])
+        if tail is not None:
+            # Not path[-tail:], which is the whole path when tail is 0
+            return path[max(len(path) - tail, 0):]
+        return path
+
+
+if __name__ == '__main__':
+    from costmap import Costmap2D
+    from obstacle import Obstacle
+    from a_star import octile
+    import time
+
+    c = Costmap2D(10, 20, resolution=0.5)
+    c.goal = (0, 0)
+    c.start = (c.width - 1, c.height - 1)
+    Obstacle(4, 3, 3, 3).draw(c)
+    Obstacle(5, 9, 3, 3).draw(c)
+    Obstacle(4, 16, 3, 3).draw(c)
+
+    a_star = JumpPointAStar(c, c.start, c.goal, octile)
+
+    start = time.time()
+    a_star.solve()
+    end = time.time()
+
+    print 'Octile:', end - start
+    print a_star.path
+
+    try:
+        from matplotlib.pylab import imshow, show
+        imshow(a_star.field.data, interpolation='nearest')
+        show()
+    except ImportError:
+        print c
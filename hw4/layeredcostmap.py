@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from costmap import Costmap2D
+from obstacle import Obstacle
+from distancetransform import metrics
+
+# The layers of a LayeredCostmap2D by default, after the planning cost grid
+DEFAULT_LAYERS = [
+    ('obstacle', 'uint8'),
+    ('inflation', 'uint8'),
+    ('distance', 'float32'),
+    ('potential', 'float32'),
+]
+
+# Byte alignment of every layer in the block
+ALIGNMENT = 16
+
+# Inflation cost of the cells within the inscribed radius of an obstacle
+INSCRIBED_COST = 253
+
+
+class LayeredCostmap2D(Costmap2D):
+    """
+    A Costmap2D that keeps typed input layers next to its planning grid.
+
+    Every layer, the planning grid (data) included, is a view into one
+    contiguous block of memory, self.block, each aligned to ALIGNMENT bytes.
+    The planning grid is what the planners read and write as before, the
+    other layers are only written on purpose, so a planner writing its
+    scores into data no longer destroys the inputs the next one needs.
+    compose() rebuilds the planning grid from the layers in one pass.
+
+    Obstacle.draw writes the obstacle layer along with the planning grid,
+    so the obstacles survive planners that paint over them.
+    """
+    def __init__(self, width=1, height=1, dtype='int16', resolution=1.0,
+                 layers=DEFAULT_LAYERS):
+        Costmap2D.__init__(self, width, height, dtype, resolution)
+        shape = (self.width, self.height)
+        table = [('cost', dtype)] + [(name, layer_dtype)
+                                     for name, layer_dtype in layers]
+        if len(set(name for name, layer_dtype in table)) != len(table):
+            raise ValueError("Layer names must be unique and not 'cost', got "
+                             "{}".format([name for name, _ in layers]))
+
+        # (name, dtype, byte offset) of every layer in the block
+        self.layer_table = []
+        offset = 0
+        for name, layer_dtype in table:
+            layer_dtype = np.dtype(layer_dtype)
+            self.layer_table.append((name, layer_dtype, offset))
+            offset += layer_dtype.itemsize * self.width * self.height
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        self.block = np.zeros(offset, dtype=np.uint8)
+
+        self.layers = {}
+        for name, layer_dtype, offset in self.layer_table:
+            size = layer_dtype.itemsize * self.width * self.height
+            self.layers[name] = self.block[offset:offset + size] \
+                .view(layer_dtype).reshape(shape)
+        self.data = self.layers['cost']
+
+    def layer(self, name):
+        """Returns the named layer, a (width, height) view into the block"""
+        if name not in self.layers:
+            raise KeyError("Unknown layer '{}', expected one of {}"
+                           .format(name, sorted(self.layers)))
+        return self.layers[name]
+
+    def update_distance(self, metric='euclidean'):
+        """
+        Fills the distance layer with the distance, in map units, from every
+        cell to the nearest obstacle, inf where there is none.
+        """
+        distance = self.layer('distance')
+        distance[:] = metrics[metric](self.layer('obstacle') != 0)
+        distance *= self.resolution
+        return distance
+
+    def inflate(self, inscribed_radius, inflation_radius):
+        """
+        Fills the inflation layer from the distance layer: INSCRIBED_COST
+        within inscribed_radius of an obstacle, falling linearly to 0 at
+        inflation_radius (both in map units).
+        """
+        distance = self.layer('distance')
+        span = max(inflation_radius - inscribed_radius, self.resolution)
+        cost = INSCRIBED_COST * (inflation_radius - distance) / span
+        cost = np.clip(cost, 0, INSCRIBED_COST)
+        inflation = self.layer('inflation')
+        if np.issubdtype(inflation.dtype, np.integer):
+            cost = np.minimum(np.rint(cost), np.iinfo(inflation.dtype).max)
+        inflation[:] = cost
+        return inflation
+
+    def compose(self, weights=None):
+        """
+        Writes the planning grid, the weighted sum of the layers in weights
+        (a {layer name: weight} dict, by default the inflation alone),
+        rounded and clipped to the grid's dtype, with -1 at the obstacles.
+        The costmap is written once, so on_update is called once.
+        """
+        if weights is None:
+            weights = {'inflation': 1.0}
+        cost = np.zeros((self.width, self.height))
+        for name, weight in weights.items():
+            if name in ('cost', 'obstacle'):
+                raise ValueError("Layer '{}' can't be composed".format(name))
+            cost += weight * self.layer(name)
+        if np.issubdtype(self.data.dtype, np.integer):
+            info = np.iinfo(self.data.dtype)
+            cost = np.clip(np.rint(cost), 0, info.max)
+        if 'obstacle' in self.layers:
+            cost[self.layers['obstacle'] != 0] = -1
+        self[:, :] = cost
+        return self.data
+
+    def clear(self):
+        """Resets the planning grid to the obstacles alone"""
+        return self.compose({})
+
+
+if __name__ == '__main__':
+    import time
+
+    c = LayeredCostmap2D(10, 20, resolution=0.5)
+    Obstacle(3, 3, 3, 3).draw(c)
+    Obstacle(5, 9, 3, 3).draw(c)
+    Obstacle(4, 16, 3, 3).draw(c)
+    print 'Layers:', [(name, str(dtype), offset)
+                      for name, dtype, offset in c.layer_table]
+    c.update_distance()
+    c.inflate(0.5, 2.0)
+    print c.compose()
+
+    big = LayeredCostmap2D(2000, 2000)
+    Obstacle(500, 0, 50, 1500).draw(big)
+    Obstacle(1000, 500, 50, 1500).draw(big)
+    print 'Block:', big.block.nbytes // (1024 * 1024), 'MB'
+    start = time.time()
+    big.update_distance()
+    big.inflate(5.0, 50.0)
+    end = time.time()
+    print 'Distance and inflation 2000x2000:', end - start
+    start = time.time()
+    big.compose()
+    end = time.time()
+    print 'Compose 2000x2000:', end - start
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+A binary costmap file format that is opened with np.memmap.
+
+The file starts with a header, then a table of its layers, then the layers
+themselves, each a (width, height) array starting on a page boundary:
+
+    magic 'CMAP', version (uint16), layer count (uint16),
+    width, height (uint32), resolution (float64)
+    per layer: name (16 bytes), numpy dtype string (8 bytes), offset (uint64)
+
+All little endian.  The first layer is the planning grid ('cost').  Opening
+a file maps it without reading it, so opening is instant whatever the size
+and only the pages that are touched are ever loaded.  Processes that open
+the same file read only share those pages through the page cache.
+"""
+
+import mmap
+import pickle
+import struct
+
+import numpy as np
+
+from obstacle import Obstacle
+from layeredcostmap import LayeredCostmap2D
+
+MAGIC = 'CMAP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIId')
+LAYER_ENTRY = struct.Struct('<16s8sQ')
+# Layers start on a page boundary, so each maps on its own pages
+PAGE = mmap.ALLOCATIONGRANULARITY
+
+
+def layer_offsets(width, height, table):
+    """
+    Returns the [(name, dtype, offset)] of the layers in table, a list of
+    (name, dtype), and the size of the file holding them.
+    """
+    offset = HEADER.size + LAYER_ENTRY.size * len(table)
+    layers = []
+    for name, dtype in table:
+        dtype = np.dtype(dtype).newbyteorder('<')
+        offset = -(-offset // PAGE) * PAGE
+        layers.append((name, dtype, offset))
+        offset += dtype.itemsize * width * height
+    return layers, offset
+
+
+def write_header(output, width, height, resolution, layers):
+    output.write(HEADER.pack(MAGIC, VERSION, len(layers), width, height,
+                             resolution))
+    for name, dtype, offset in layers:
+        if len(name) > 16:
+            raise ValueError("Layer name '{}' is longer than 16 characters"
+                             .format(name))
+        output.write(LAYER_ENTRY.pack(name, dtype.str, offset))
+
+
+def read_header(path):
+    """Returns the width, height, resolution and layers of a costmap file"""
+    with open(path, 'rb') as input:
+        header = input.read(HEADER.size)
+        if len(header) < HEADER.size or header[:4] != MAGIC:
+            raise ValueError("'{}' is not a costmap file".format(path))
+        magic, version, count, width, height, resolution = \
+            HEADER.unpack(header)
+        if version != VERSION:
+            raise ValueError("'{}' is version {}, expected {}"
+                             .format(path, version, VERSION))
+        layers = []
+        for i in range(count):
+            name, dtype, offset = LAYER_ENTRY.unpack(
+                input.read(LAYER_ENTRY.size))
+            layers.append((name.rstrip('\0'), np.dtype(dtype.rstrip('\0')),
+                           offset))
+    return width, height, resolution, layers
+
+
+def create_costmap_file(path, width, height, dtype='int16', resolution=1.0,
+                        layers=()):
+    """
+    Creates a zeroed costmap file of width x height cells (the file is
+    sparse where the filesystem allows it) with the planning grid and the
+    given (name, dtype) layers, and returns it opened for writing.
+    """
+    table, size = layer_offsets(width, height,
+                                [('cost', dtype)] + list(layers))
+    with open(path, 'wb') as output:
+        write_header(output, width, height, resolution, table)
+        output.truncate(size)
+    return MappedCostmap2D(path, mode='r+')
+
+
+def save_costmap(costmap, path):
+    """
+    Writes a Costmap2D (with its layers, if it is a LayeredCostmap2D) to a
+    costmap file.
+    """
+    if hasattr(costmap, 'layer_table'):
+        table = [(name, dtype) for name, dtype, offset in costmap.layer_table]
+        arrays = [costmap.layers[name] for name, dtype in table]
+    else:
+        table = [('cost', costmap.data.dtype)]
+        arrays = [costmap.data]
+    layers, size = layer_offsets(costmap.width, costmap.height, table)
+    with open(path, 'wb') as output:
+        write_header(output, costmap.width, costmap.height,
+                     costmap.resolution, layers)
+        for (name, dtype, offset), array in zip(layers, arrays):
+            output.seek(offset)
+            np.ascontiguousarray(array, dtype=dtype).tofile(output)
+        output.truncate(size)
+
+
+def open_costmap(path, mode='r'):
+    """Opens a costmap file, see MappedCostmap2D"""
+    return MappedCostmap2D(path, mode)
+
+
+class MappedCostmap2D(LayeredCostmap2D):
+    """
+    A LayeredCostmap2D whose block is a costmap file mapped with np.memmap,
+    so data and the layers are read and written in the file itself.
+
+    mode is np.memmap's: 'r' read only (writes raise), 'r+' read and write,
+    'c' copy on write (writes stay in memory).  Writes reach the file when
+    the pages are written back by the OS, flush() forces it.  Pickling a
+    MappedCostmap2D pickles only its path and mode, so pool workers reopen
+    the file instead of copying the map.  A 'c' map can't be pickled, its
+    writes are not in the file for the workers to see.
+    """
+    def __init__(self, path, mode='r'):
+        width, height, resolution, layers = read_header(path)
+        self.path = path
+        self.mode = mode
+        self.width = width
+        self.height = height
+        self.resolution = resolution
+        self.layer_table = layers
+        self.block = np.memmap(path, dtype=np.uint8, mode=mode)
+
+        self.layers = {}
+        for name, dtype, offset in layers:
+            size = dtype.itemsize * width * height
+            self.layers[name] = self.block[offset:offset + size] \
+                .view(dtype).reshape(width, height)
+        if 'cost' not in self.layers:
+            raise ValueError("'{}' has no cost layer".format(path))
+        self.data = self.layers['cost']
+        self.dtype = self.data.dtype.name
+
+        self.init_notifications()
+
+    def __reduce__(self):
+        if self.mode == 'c':
+            raise pickle.PicklingError("A copy on write costmap can't be "
+                                       "pickled, its writes are not in '{}'"
+                                       .format(self.path))
+        return (open_costmap, (self.path, self.mode))
+
+    def flush(self):
+        """Writes the changes made so far to the file"""
+        if self.mode == 'r+':
+            self.block.flush()
+
+
+if __name__ == '__main__':
+    import os
+    import time
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'field.cmap')
+
+    c = LayeredCostmap2D(10, 20, resolution=0.5)
+    Obstacle(3, 3, 3, 3).draw(c)
+    Obstacle(5, 9, 3, 3).draw(c)
+    Obstacle(4, 16, 3, 3).draw(c)
+    c.update_distance()
+    c.inflate(0.5, 2.0)
+    c.compose()
+    save_costmap(c, path)
+    m = open_costmap(path)
+    print 'Same after a round trip:', (m.data == c.data).all() and \
+        all((m.layers[name] == c.layers[name]).all() for name in c.layers)
+
+    start = time.time()
+    big = create_costmap_file(path, 20000, 20000,
+                              layers=[('obstacle', 'uint8')])
+    Obstacle(500, 0, 50, 1500).draw(big)
+    big.flush()
+    end = time.time()
+    print 'Create and draw 20000x20000:', end - start
+    del big
+
+    start = time.time()
+    big = open_costmap(path)
+    end = time.time()
+    print 'Open %d MB:' % (os.path.getsize(path) // (1024 * 1024)), \
+        end - start
+    print 'Obstacle cells in the first 2000 columns:', \
+        (big.data[:2000] == -1).sum()
+    del big
+    os.remove(path)
+    os.rmdir(directory)
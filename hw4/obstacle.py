@@ -15,6 +15,10 @@ class Obstacle(object):
         o = (int(self.origin[0]/costmap.resolution), int(self.origin[1]/costmap.resolution))
         s = (int(self.size[0]/costmap.resolution), int(self.size[1]/costmap.resolution))
         costmap[o[0]:o[0]+s[0], o[1]:o[1]+s[1]] = value
+        # A layered costmap keeps its obstacles apart from the planning grid
+        layers = getattr(costmap, 'layers', {})
+        if 'obstacle' in layers:
+            layers['obstacle'][o[0]:o[0]+s[0], o[1]:o[1]+s[1]] = value == -1
     
 
 if __name__ == '__main__':
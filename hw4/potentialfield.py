@@ -2,40 +2,145 @@
 
 import sys
 
+import numpy as np
+
 from costmap import Costmap2D
 from obstacle import Obstacle
 
+def repulsion_kernel(roi):
+    """
+    Returns the repulsion of an obstacle on the cells around it, the squared
+    distance within the region of influence and 0 outside of it, as a
+    square array centered on the obstacle.
+    """
+    radius = int(np.floor(np.sqrt(roi)))
+    offsets = np.arange(-radius, radius + 1)
+    squared = offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2
+    return np.where(squared <= roi, squared, 0).astype(float)
+
+
+def fft_size(n):
+    """Returns the smallest size >= n with no prime factors above 5"""
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+
+def convolve(mask, kernel):
+    """
+    Returns the sum of kernel centered on every True cell of mask, cropped to
+    mask's shape, using the FFT so the cost does not depend on how many
+    cells are True.
+    """
+    radius = kernel.shape[0] // 2
+    shape = (mask.shape[0] + 2 * radius, mask.shape[1] + 2 * radius)
+    shape = (fft_size(shape[0]), fft_size(shape[1]))
+    total = np.fft.irfft2(np.fft.rfft2(mask.astype(float), shape) *
+                          np.fft.rfft2(kernel, shape), shape)
+    # The kernel holds integers, so the sums are integers too
+    return np.rint(total[radius:radius + mask.shape[0],
+                         radius:radius + mask.shape[1]])
+
+
 class PotentialField(object):
-    """This class represents a Potential Field algorithm"""
-    def __init__(self, costmap, start = (0,0), goal = None):
+    """
+    This class represents a Potential Field algorithm
+    
+    With vectorized=True the field is computed with array operations: the
+    first step adds the attraction to the goal for every cell, the second
+    the repulsion of every obstacle at once, as a convolution of the
+    obstacles with the repulsion kernel.  The field is also kept unclipped
+    as floats in self.potential (inf at the obstacles), since it overflows
+    the costmap's dtype on large maps.
+    """
+    def __init__(self, costmap, start = (0,0), goal = None, vectorized=False):
         self.costmap = costmap
         self.start = start
         if goal == None:
-            self.goal = (self.costmap.width-1, self.costmap.height-1)
+            goal = (self.costmap.width-1, self.costmap.height-1)
+        self.goal = goal
+        self.vectorized = vectorized
         
         self.katt = 1.0
         self.krep = 1.0
         self.roi = 100.0 # Region of Influence
         self.obstacle_cells = []
+        self.potential = None
+        # The steepest descent neighbor of every cell, see prepare_descent
+        self.descent = None
+        self.path = np.zeros((0, 2), dtype=int)
         
         self.first_run = True
+        self.repulsion_added = False
     
     def prepare_field(self):
         """Prepares the potential field"""
         gx, gy = self.goal
-        for (x, row) in enumerate(self.costmap.data):
-            for (y, cell) in enumerate(row):
-                if cell == -1.0: # If obstacle
-                    self.obstacle_cells.append((x,y))
-                else:
-                    self.costmap.data[x,y] = self.distance(x,y,gx,gy)
+        with self.costmap.batch():
+            for (x, row) in enumerate(self.costmap.data):
+                for (y, cell) in enumerate(row):
+                    if cell == -1.0: # If obstacle
+                        self.obstacle_cells.append((x,y))
+                    else:
+                        self.costmap[x,y] = self.distance(x,y,gx,gy)
     
     def distance(self, x, y, x_, y_):
         """Returns the potential at the given point"""
         return (x - x_)**2 + (y - y_)**2
     
+    def prepare_potential(self):
+        """Sets the potential of every free cell to its attraction to the goal"""
+        gx, gy = self.goal
+        x, y = np.indices(self.costmap.data.shape)
+        self.blocked = self.costmap.data == -1
+        self.potential = self.katt * ((x - gx) ** 2 + (y - gy) ** 2).astype(float)
+        self.potential[self.blocked] = np.inf
+    
+    def add_repulsion(self):
+        """Adds the repulsion of every obstacle to the potential"""
+        if self.blocked.any():
+            self.potential += self.krep * convolve(self.blocked,
+                                                   repulsion_kernel(self.roi))
+            self.potential[self.blocked] = np.inf
+    
+    def write_potential(self):
+        """Writes the potential of the free cells into the costmap, at once"""
+        values = self.potential[~self.blocked]
+        if np.issubdtype(self.costmap.data.dtype, np.integer):
+            info = np.iinfo(self.costmap.data.dtype)
+            values = np.clip(values, info.min, info.max)
+        self.costmap[~self.blocked] = values
+        # A layered costmap keeps the unclipped field in its potential layer
+        layers = getattr(self.costmap, 'layers', {})
+        if 'potential' in layers:
+            layers['potential'][:] = self.potential
+    
+    def step_potential(self):
+        """The vectorized step_solution"""
+        if self.first_run:
+            self.first_run = False
+            self.prepare_potential()
+            self.write_potential()
+            return True
+        if self.repulsion_added:
+            return False
+        self.repulsion_added = True
+        self.add_repulsion()
+        self.write_potential()
+        return True
+    
     def step_solution(self):
         """This steps the solution, returns True if more work is required, otherwise False"""
+        self.descent = None
+        if self.vectorized:
+            return self.step_potential()
+        # prepare_descent copies the costmap, which every step changes
+        self.potential = None
         if self.first_run:
             self.first_run = False
             self.prepare_field()
@@ -57,6 +162,114 @@ class PotentialField(object):
         while self.step_solution():
             pass
     
+    def prepare_descent(self):
+        """
+        Precomputes the steepest descent neighbor of every cell (itself if no
+        neighbor is lower), once per field, so paths can be followed without
+        looking at the potential again
+        """
+        if self.potential is None:
+            # The cell by cell field only lives in the costmap
+            self.blocked = self.costmap.data == -1
+            self.potential = self.costmap.data.astype(float)
+            self.potential[self.blocked] = np.inf
+        width, height = self.potential.shape
+        padded = np.pad(self.potential, 1, mode='constant',
+                        constant_values=np.inf)
+        index = np.arange(width * height).reshape(width, height)
+        descent = index.copy()
+        steepest = np.zeros((width, height))
+        with np.errstate(invalid='ignore'):
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    if not dx and not dy:
+                        continue
+                    slope = (padded[1 + dx:1 + dx + width, 1 + dy:1 + dy + height]
+                             - self.potential) / np.hypot(dx, dy)
+                    steeper = slope < steepest
+                    steepest[steeper] = slope[steeper]
+                    descent[steeper] = index[steeper] + dx * height + dy
+        self.descent = descent.ravel()
+        goal = self.goal[0] * height + self.goal[1]
+        self.descent[goal] = goal
+        # The way out of every local minimum escaped so far
+        self.escapes = {}
+    
+    def local_minima(self):
+        """Returns the free cells, other than the goal, a descent gets stuck in"""
+        if self.descent is None:
+            self.prepare_descent()
+        stuck = self.descent == np.arange(self.descent.size)
+        stuck &= ~self.blocked.ravel()
+        stuck[self.goal[0] * self.costmap.height + self.goal[1]] = False
+        return np.argwhere(stuck.reshape(self.potential.shape))
+    
+    def escape(self, cell):
+        """
+        Brushfire out of the local minimum at cell (flat index) to the nearest
+        cell with a lower potential, or the goal.  Returns the flat indices of
+        the way there, or None if there is no such cell.
+        """
+        goal = self.goal[0] * self.costmap.height + self.goal[1]
+        came_from = {cell: None}
+        # Breadth first, a whole ring of cells at a time
+        frontier = np.array([cell], dtype=np.intp)
+        while len(frontier):
+            found = (frontier == goal) | \
+                (self.potential.flat[frontier] < self.potential.flat[cell])
+            if found.any():
+                way = [int(frontier[np.argmax(found)])]
+                while came_from[way[-1]] != cell:
+                    way.append(came_from[way[-1]])
+                return way[::-1]
+            neighbors, valid = self.costmap.get_neighbor_indices(frontier)
+            valid[valid] = ~self.blocked.flat[neighbors[valid]]
+            sources = np.repeat(frontier, neighbors.shape[1])
+            ring = []
+            for x, y in zip(sources[valid.ravel()].tolist(),
+                            neighbors[valid].tolist()):
+                if y not in came_from:
+                    came_from[y] = x
+                    ring.append(y)
+            frontier = np.array(ring, dtype=np.intp)
+        return None
+    
+    def plan(self, start=None):
+        """
+        Returns the path from start (by default self.start) to the goal
+        following the steepest descent of the field, as an (N, 2) array of
+        x, y.  Local minima are escaped with a brushfire to the nearest lower
+        cell.  The path is empty if the goal can not be reached.
+        """
+        if self.descent is None:
+            self.prepare_descent()
+        if start is None:
+            start = self.start
+        height = self.costmap.height
+        self.path = np.zeros((0, 2), dtype=int)
+        if self.blocked[start[0], start[1]]:
+            return self.path
+        goal = self.goal[0] * height + self.goal[1]
+        descent = self.descent
+        cell = start[0] * height + start[1]
+        path = [cell]
+        while cell != goal:
+            onward = descent[cell]
+            if onward == cell:
+                if cell not in self.escapes:
+                    self.escapes[cell] = self.escape(cell)
+                way = self.escapes[cell]
+                if way is None:
+                    return self.path
+                path.extend(way)
+                cell = way[-1]
+            else:
+                path.append(onward)
+                cell = onward
+        path = np.array(path)
+        self.path = np.column_stack([path // height, path % height])
+        return self.path
+    
 
 if __name__ == '__main__':
     c = Costmap2D(10,20, resolution=1.0)
@@ -68,6 +281,8 @@ if __name__ == '__main__':
     # imshow(c.data.T, interpolation='nearest')
     # show()
     pf.solve()
+    print pf.plan((0, 0))
+    print 'Local minima:', len(pf.local_minima())
     try:
         from matplotlib.pylab import imshow, show
         imshow(c.data.T, interpolation='nearest')
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+
+class IndexedPriorityQueue(object):
+    """
+    A binary min-heap that keeps an index of where every item lives.
+
+    Items must be hashable and are ordered by (priority, item), so ties are
+    broken the same way a heapq of (priority, item) tuples would break them.
+    The index gives O(1) membership tests and lets push() change the
+    priority of an item already in the queue (decrease-key) instead of
+    leaving stale entries behind.
+    """
+    def __init__(self):
+        self.heap = []
+        self.position = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, item):
+        return item in self.position
+
+    def __iter__(self):
+        return (entry[1] for entry in self.heap)
+
+    def __getitem__(self, item):
+        return self.heap[self.position[item]][0]
+
+    def push(self, item, priority):
+        """Adds item to the queue, or moves it if it is already queued"""
+        if item in self.position:
+            index = self.position[item]
+            old_priority = self.heap[index][0]
+            self.heap[index] = (priority, item)
+            if priority < old_priority:
+                self._sift_up(index)
+            else:
+                self._sift_down(index)
+        else:
+            self.heap.append((priority, item))
+            self.position[item] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+
+    def peek(self):
+        """Returns the lowest (priority, item) without removing it"""
+        return self.heap[0]
+
+    def pop(self):
+        """Removes and returns the lowest (priority, item)"""
+        last = self.heap.pop()
+        if not self.heap:
+            del self.position[last[1]]
+            return last
+        top = self.heap[0]
+        del self.position[top[1]]
+        self.heap[0] = last
+        self.position[last[1]] = 0
+        self._sift_down(0)
+        return top
+
+    def remove(self, item):
+        """Removes item from the queue, raises KeyError if it is not queued"""
+        index = self.position.pop(item)
+        removed = self.heap[index]
+        last = self.heap.pop()
+        if index == len(self.heap):
+            return
+        self.heap[index] = last
+        self.position[last[1]] = index
+        if last < removed:
+            self._sift_up(index)
+        else:
+            self._sift_down(index)
+
+    def _sift_up(self, index):
+        heap, position = self.heap, self.position
+        entry = heap[index]
+        while index > 0:
+            parent = (index - 1) >> 1
+            if entry < heap[parent]:
+                heap[index] = heap[parent]
+                position[heap[index][1]] = index
+                index = parent
+            else:
+                break
+        heap[index] = entry
+        position[entry[1]] = index
+
+    def _sift_down(self, index):
+        heap, position = self.heap, self.position
+        size = len(heap)
+        entry = heap[index]
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if heap[child] < entry:
+                heap[index] = heap[child]
+                position[heap[index][1]] = index
+                index = child
+            else:
+                break
+        heap[index] = entry
+        position[entry[1]] = index
+
+
+if __name__ == '__main__':
+    q = IndexedPriorityQueue()
+    q.push((1, 1), 5.0)
+    q.push((2, 2), 3.0)
+    q.push((3, 3), 4.0)
+    print (2, 2) in q, (4, 4) in q
+    q.push((1, 1), 1.0)
+    print q.pop() == (1.0, (1, 1))
+    print q.pop() == (3.0, (2, 2))
+    print len(q) == 1
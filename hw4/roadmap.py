@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+import heapq
+from collections import deque
+
+import numpy as np
+
+from costmap import Costmap2D
+from obstacle import Obstacle
+from a_star import octile
+from voronoi import voronoi_ridges
+
+# Neighbor offsets, the straight ones first, then the diagonals with the two
+# straight offsets they cut between
+STRAIGHT = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+DIAGONAL = [((1, 1), (1, 0), (0, 1)), ((1, -1), (1, 0), (0, -1)),
+            ((-1, 1), (-1, 0), (0, 1)), ((-1, -1), (-1, 0), (0, -1))]
+
+
+def path_length(cells):
+    """Returns the length of a path of cells, in cells"""
+    if len(cells) < 2:
+        return 0.0
+    steps = np.abs(np.diff(cells, axis=0)).sum(axis=1)
+    return float(np.where(steps == 2, np.sqrt(2), 1.0).sum())
+
+
+class VoronoiRoadmap(object):
+    """
+    VoronoiRoadmap is a sparse graph of the generalized Voronoi diagram of a
+    costmap, for maximum clearance paths.
+
+    The ridge cells of the diagram are joined into a graph whose nodes are
+    the junctions and dead ends of the ridges and whose edges are the ridge
+    lines between them.  Ridge cells are neighbors when they touch
+    straight, or diagonally when no ridge cell touches both of them, so
+    ridges run one cell wide.  Every edge knows its cells, its length and
+    its clearance (the smallest clearance along it), in map units.
+
+    A query climbs the clearance from start and goal onto the ridges, then
+    searches the graph, which is far smaller than the grid.  The roadmap is
+    a snapshot, build a new one when the obstacles change.
+    """
+    def __init__(self, costmap):
+        """
+        Creates a new VoronoiRoadmap, extracting the ridges and the graph.
+        """
+        self.costmap = costmap
+        self.resolution = costmap.resolution
+        self.ridge, self.clearance, self.labels = voronoi_ridges(costmap)
+        self.blocked = costmap.data == -1
+
+        # Node cells and their clearance
+        self.nodes = {}
+        # (a, b, cells, length, clearance) of every edge, cells run a to b
+        self.edges = []
+        # {node: [(node, edge index)]}
+        self.adjacency = {}
+        # The edge and position along it of the ridge cells between nodes
+        self.edge_of = {}
+
+        # The last path found, an (N, 2) array of x, y
+        self.path = np.zeros((0, 2), dtype=int)
+
+        self.build_graph()
+
+    def ridge_neighbors(self, cell):
+        """Returns the ridge cells next to cell"""
+        x, y = cell
+        width, height = self.ridge.shape
+
+        def on_ridge(dx, dy):
+            return 0 <= x + dx < width and 0 <= y + dy < height and \
+                self.ridge[x + dx, y + dy]
+
+        neighbors = [(x + dx, y + dy) for dx, dy in STRAIGHT if on_ridge(dx, dy)]
+        for (dx, dy), first, second in DIAGONAL:
+            if on_ridge(dx, dy) and not on_ridge(*first) and \
+               not on_ridge(*second):
+                neighbors.append((x + dx, y + dy))
+        return neighbors
+
+    def ridge_degrees(self):
+        """Returns how many ridge neighbors every cell has"""
+        ridge = np.pad(self.ridge, 1, mode='constant')
+        width, height = self.ridge.shape
+
+        def shifted(dx, dy):
+            return ridge[1 + dx:1 + dx + width, 1 + dy:1 + dy + height]
+
+        degrees = sum(shifted(dx, dy).astype(int) for dx, dy in STRAIGHT)
+        for (dx, dy), first, second in DIAGONAL:
+            degrees += shifted(dx, dy) & ~shifted(*first) & ~shifted(*second)
+        return degrees
+
+    def build_graph(self):
+        """Traces the ridges into nodes and edges"""
+        degrees = self.ridge_degrees()
+        for x, y in np.argwhere(self.ridge & (degrees != 2)):
+            self.add_node((x, y))
+        for node in list(self.nodes):
+            self.trace_from(node)
+        # What is left are loops with no junction on them
+        for x, y in np.argwhere(self.ridge):
+            cell = (x, y)
+            if cell not in self.nodes and cell not in self.edge_of:
+                self.add_node(cell)
+                self.trace_from(cell)
+
+    def add_node(self, cell):
+        self.nodes[cell] = float(self.clearance[cell])
+        self.adjacency[cell] = []
+
+    def trace_from(self, node):
+        """Follows every ridge leaving node that has not been traced yet"""
+        for first in self.ridge_neighbors(node):
+            if first in self.edge_of:
+                continue
+            if first in self.nodes and \
+               any(other == first and len(self.edges[index][2]) == 2
+                   for other, index in self.adjacency[node]):
+                continue
+            cells = [node, first]
+            while cells[-1] not in self.nodes:
+                previous, current = cells[-2], cells[-1]
+                onward = [cell for cell in self.ridge_neighbors(current)
+                          if cell != previous]
+                if not onward:
+                    break
+                cells.append(onward[0])
+            self.add_edge(cells)
+
+    def add_edge(self, cells):
+        """Adds the edge along cells, between its first and last cell"""
+        a, b = cells[0], cells[-1]
+        if b not in self.nodes:
+            self.add_node(b)
+        cells = np.array(cells, dtype=int)
+        index = len(self.edges)
+        self.edges.append((a, b, cells,
+                           path_length(cells) * self.resolution,
+                           float(self.clearance[cells[:, 0], cells[:, 1]].min())))
+        self.adjacency[a].append((b, index))
+        if a != b:
+            self.adjacency[b].append((a, index))
+        for position, (x, y) in enumerate(cells[1:-1], 1):
+            self.edge_of[(x, y)] = (index, position)
+
+    def retract(self, cell):
+        """
+        Returns the cells from cell to the nearest ridge, climbing the
+        clearance and searching outwards if that gets stuck, or None if no
+        ridge can be reached.
+        """
+        path = [cell]
+        height = self.costmap.height
+        while not self.ridge[cell]:
+            neighbors, valid = self.costmap.get_neighbor_indices([cell])
+            neighbors = neighbors[valid]
+            best = neighbors[np.argmax(self.clearance.flat[neighbors])]
+            best = (int(best // height), int(best % height))
+            if self.blocked[best] or \
+               self.clearance[best] <= self.clearance[cell]:
+                break
+            cell = best
+            path.append(cell)
+        if self.ridge[cell]:
+            return path
+
+        came_from = {cell: None}
+        queue = deque([cell])
+        while queue:
+            x = queue.popleft()
+            if self.ridge[x]:
+                tail = [x]
+                while came_from[tail[-1]] != cell:
+                    tail.append(came_from[tail[-1]])
+                return path + tail[::-1]
+            for y in self.costmap.get_neighbors(*x):
+                if y not in came_from and not self.blocked[y]:
+                    came_from[y] = x
+                    queue.append(y)
+        return None
+
+    def entry_links(self, cell):
+        """
+        Returns the (node, cells, length, clearance) links from a ridge cell
+        to the graph, cells running from cell to the node.
+        """
+        if cell in self.nodes:
+            return [(cell, np.array([cell]), 0.0, self.nodes[cell])]
+        index, position = self.edge_of[cell]
+        a, b, cells, length, clearance = self.edges[index]
+        links = []
+        for node, part in ((a, cells[position::-1]), (b, cells[position:])):
+            links.append((node, part, path_length(part) * self.resolution,
+                          float(self.clearance[part[:, 0], part[:, 1]].min())))
+        return links
+
+    def search(self, start, goal, min_clearance):
+        """
+        A* over the graph between two ridge cells, returns the cells of the
+        path or None.
+        """
+        start_links = self.entry_links(start)
+        goal_links = dict((node, (part[::-1], length, clearance))
+                          for node, part, length, clearance
+                          in self.entry_links(goal))
+        # Both ends can be on the same edge, with no node between them
+        if start not in self.nodes and goal not in self.nodes and \
+           self.edge_of[start][0] == self.edge_of[goal][0]:
+            cells = self.edges[self.edge_of[start][0]][2]
+            i, j = self.edge_of[start][1], self.edge_of[goal][1]
+            part = cells[i:j + 1] if i <= j else cells[j:i + 1][::-1]
+            start_links.append((goal, part, path_length(part) * self.resolution,
+                                float(self.clearance[part[:, 0],
+                                                     part[:, 1]].min())))
+
+        def h(cell):
+            return octile(self.costmap, cell, goal) * self.resolution
+
+        g_score = {start: 0.0}
+        came_from = {start: None}
+        closedset = set()
+        openset = [(h(start), start)]
+        while openset:
+            f, x = heapq.heappop(openset)
+            if x in closedset:
+                continue
+            if x == goal:
+                parts = [np.array([goal])]
+                while came_from[x] is not None:
+                    x, part = came_from[x]
+                    parts.append(part)
+                return np.vstack(parts[::-1])
+            closedset.add(x)
+            if x == start and start not in self.nodes:
+                links = [(node, part, length)
+                         for node, part, length, clearance in start_links
+                         if clearance >= min_clearance]
+            else:
+                links = []
+                for other, index in self.adjacency.get(x, []):
+                    a, b, cells, length, clearance = self.edges[index]
+                    if clearance >= min_clearance:
+                        links.append((other, cells if a == x else cells[::-1],
+                                      length))
+                if x in goal_links and goal_links[x][2] >= min_clearance:
+                    links.append((goal,) + goal_links[x][:2])
+            for y, part, length in links:
+                if y in closedset:
+                    continue
+                tentative = g_score[x] + length
+                if tentative < g_score.get(y, np.inf):
+                    g_score[y] = tentative
+                    came_from[y] = (x, part)
+                    heapq.heappush(openset, (tentative + h(y), y))
+        return None
+
+    def plan(self, start, goal, min_clearance=0.0):
+        """
+        Returns a path from start to goal along the ridges, as an (N, 2)
+        array of x, y, that keeps at least min_clearance (map units) from
+        the obstacles between getting on and off the ridges.  The path is
+        empty if there is none.
+        """
+        start, goal = tuple(start), tuple(goal)
+        self.path = np.zeros((0, 2), dtype=int)
+        if self.blocked[start] or self.blocked[goal]:
+            return self.path
+        to_ridge = self.retract(start)
+        from_ridge = self.retract(goal)
+        if to_ridge is None or from_ridge is None:
+            return self.path
+        middle = self.search(to_ridge[-1], from_ridge[-1], min_clearance)
+        if middle is None:
+            return self.path
+        path = np.vstack([np.array(to_ridge, dtype=int).reshape(-1, 2),
+                          middle,
+                          np.array(from_ridge[::-1], dtype=int).reshape(-1, 2)])
+        # Drop the cells repeated where the pieces join
+        keep = np.ones(len(path), dtype=bool)
+        keep[1:] = (np.diff(path, axis=0) != 0).any(axis=1)
+        self.path = path[keep]
+        return self.path
+
+
+if __name__ == '__main__':
+    import time
+
+    c = Costmap2D(100, 100, resolution=0.5)
+    Obstacle(20, 0, 5, 80).draw(c)
+    Obstacle(50, 20, 5, 80).draw(c)
+    Obstacle(70, 40, 20, 20).draw(c)
+
+    start = time.time()
+    roadmap = VoronoiRoadmap(c)
+    end = time.time()
+    print 'Roadmap:', end - start, len(roadmap.nodes), 'nodes', \
+        len(roadmap.edges), 'edges'
+
+    start = time.time()
+    path = roadmap.plan((0, 0), (c.width - 1, c.height - 1))
+    end = time.time()
+    print 'Query:', end - start, len(path), 'cells'
+
+    start = time.time()
+    path = roadmap.plan((10, 10), (c.width - 10, c.height - 10),
+                        min_clearance=2.0)
+    end = time.time()
+    print 'Query keeping 2.0 away:', end - start, len(path), 'cells'
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from costmap import Costmap2D
+from obstacle import Obstacle
+
+
+class SparseCostmap2D(Costmap2D):
+    """
+    A Costmap2D that stores its cells in square tiles, allocated the first
+    time a value other than the default is written to them.  Reading an
+    untouched cell gives the default, so memory grows with the area that
+    was written (the obstacles, and whatever a planner paints), not with
+    the area of the map.
+
+    Indexing works as it does on data, with cells, slices, masks and fancy
+    indices, and get_neighbors, get_cardinals and the bulk cell and
+    neighbor lookups are the Costmap2D ones, so the planners and expansions
+    that go through those run unmodified.
+    data is a read only dense copy assembled on every access, for display
+    and for the whole map array code, writes go through the costmap.
+    """
+    def __init__(self, width=1, height=1, dtype='int16', resolution=1.0,
+                 tile_size=64, default=0):
+        self.width = int(width / float(resolution))
+        self.height = int(height / float(resolution))
+        self.resolution = resolution
+        if self.width <= 0 or self.height <= 0:
+            raise ValueError("Invalid width or height ({}x{}), less than or \
+                              equal to zero."\
+                                .format(self.width, self.height))
+        self.dtype = dtype
+        self.tile_size = tile_size
+        self.default = np.array(default, dtype=dtype)[()]
+        # {(x // tile_size, y // tile_size): tile_size x tile_size array}
+        self.tiles = {}
+        self.tiles_high = -(-self.height // tile_size)
+
+        # The x and y of every cell, as zero stride (width, height) views
+        xs = np.arange(self.width, dtype=np.intp)
+        ys = np.arange(self.height, dtype=np.intp)
+        self.xs = as_strided(xs, shape=(self.width, self.height),
+                             strides=(xs.strides[0], 0))
+        self.ys = as_strided(ys, shape=(self.width, self.height),
+                             strides=(0, ys.strides[0]))
+
+        self.init_notifications()
+
+    @property
+    def data(self):
+        data = np.empty((self.width, self.height), dtype=self.dtype)
+        data.fill(self.default)
+        size = self.tile_size
+        for (tx, ty), tile in self.tiles.items():
+            x, y = tx * size, ty * size
+            part = data[x:x + size, y:y + size]
+            part[:] = tile[:part.shape[0], :part.shape[1]]
+        # Writes to the copy would be lost, make them fail instead
+        data.flags.writeable = False
+        return data
+
+    @property
+    def nbytes(self):
+        """The memory held by the allocated tiles"""
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def new_tile(self, key):
+        tile = np.empty((self.tile_size, self.tile_size), dtype=self.dtype)
+        tile.fill(self.default)
+        self.tiles[key] = tile
+        return tile
+
+    def free_if_default(self, key, written):
+        """
+        Frees the tile at key if it is back to the default, only a write of
+        the default (some of written) can have done that.
+        """
+        if np.any(np.asarray(written) == self.default) and \
+           (self.tiles[key] == self.default).all():
+            del self.tiles[key]
+
+    def cells(self, key):
+        """Returns the x and y of the cells key selects, shaped as data[key]"""
+        return np.asarray(self.xs[key]), np.asarray(self.ys[key])
+
+    def tile_groups(self, xs, ys):
+        """
+        Yields the tile key and the positions in xs and ys (flat arrays) of
+        the cells in each tile they fall in.
+        """
+        if len(xs) == 0:
+            return
+        size = self.tile_size
+        tile_ids = (xs // size) * self.tiles_high + ys // size
+        order = np.argsort(tile_ids, kind='mergesort')
+        tile_ids = tile_ids[order]
+        starts = np.flatnonzero(np.r_[True, tile_ids[1:] != tile_ids[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts, ends):
+            yield divmod(int(tile_ids[start]), self.tiles_high), \
+                order[start:end]
+
+    def __getitem__(self, key):
+        if type(key) == tuple and len(key) == 2 and \
+           all(isinstance(k, (int, long, np.integer)) for k in key):
+            x, y = key
+            x, y = x + self.width if x < 0 else x, y + self.height if y < 0 else y
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                raise IndexError("Cell {} is outside the map".format(key))
+            tile = self.tiles.get((x // self.tile_size, y // self.tile_size))
+            if tile is None:
+                return self.default
+            return tile[x % self.tile_size, y % self.tile_size]
+        xs, ys = self.cells(key)
+        values = np.empty(xs.shape, dtype=self.dtype)
+        values.fill(self.default)
+        flat, xs, ys = values.reshape(-1), xs.ravel(), ys.ravel()
+        for tile_key, where in self.tile_groups(xs, ys):
+            tile = self.tiles.get(tile_key)
+            if tile is not None:
+                flat[where] = tile[xs[where] % self.tile_size,
+                                   ys[where] % self.tile_size]
+        return values[()] if values.ndim == 0 else values
+
+    def __setitem__(self, key, val):
+        self.write(key, val)
+        if self.batch_depth:
+            self.mark_dirty(self.region(key))
+        elif self.on_update != None:
+            self.on_update(key, val)
+
+    def write(self, key, val):
+        """Writes val to the cells key selects, allocating tiles as needed"""
+        size = self.tile_size
+        if type(key) == tuple and len(key) == 2 and \
+           all(isinstance(k, (int, long, np.integer)) for k in key):
+            x, y = key
+            x, y = x + self.width if x < 0 else x, y + self.height if y < 0 else y
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                raise IndexError("Cell {} is outside the map".format(key))
+            tile = self.tiles.get((x // size, y // size))
+            if tile is None:
+                if val == self.default:
+                    return
+                tile = self.new_tile((x // size, y // size))
+            tile[x % size, y % size] = val
+            self.free_if_default((x // size, y // size), val)
+            return
+        xs, ys = self.cells(key)
+        values = np.asarray(val)
+        scalar = values.ndim == 0
+        if not scalar:
+            values = np.broadcast_to(values, xs.shape).ravel()
+        xs, ys = xs.ravel(), ys.ravel()
+        for tile_key, where in self.tile_groups(xs, ys):
+            part = values if scalar else values[where]
+            tile = self.tiles.get(tile_key)
+            if tile is None:
+                if np.all(part == self.default):
+                    continue
+                tile = self.new_tile(tile_key)
+            tile[xs[where] % size, ys[where] % size] = part
+            self.free_if_default(tile_key, part)
+
+
+if __name__ == '__main__':
+    import time
+    from a_star import AStar, octile
+    from brushfire import BrushfireExpansion
+    from voronoi import VoronoiExpansion
+    from potentialfield import PotentialField
+
+    # A 200m x 200m field at 5cm cells, dense that would be 4000x4000 cells
+    field = SparseCostmap2D(200, 200, resolution=0.05)
+    Obstacle(50, 0, 2, 150).draw(field)
+    Obstacle(100, 50, 2, 150).draw(field)
+    dense = field.width * field.height * np.dtype(field.dtype).itemsize
+    print 'Tiles:', len(field.tiles), field.nbytes // 1024, 'kB of', \
+        dense // 1024, 'kB dense'
+
+    c = SparseCostmap2D(10, 20, resolution=0.5, tile_size=8)
+    Obstacle(3, 3, 3, 3).draw(c)
+    Obstacle(5, 9, 3, 3).draw(c)
+    Obstacle(4, 16, 3, 3).draw(c)
+    start = time.time()
+    a = AStar(c, (0, 0), (c.width - 1, c.height - 1), octile)
+    while a.step_solution():
+        pass
+    end = time.time()
+    print 'A*:', end - start, len(a.path), 'cells,', len(c.tiles), 'tiles'
+    print c
+
+    # The planners and expansions give the same results on both kinds of map
+    def brushfire(costmap):
+        be = BrushfireExpansion(costmap)
+        be.set_ignition_cells([(0, 0)])
+        be.solve()
+    runs = [
+        ('A*', lambda costmap: AStar(costmap, (0, 0), (costmap.width - 1,
+                                     costmap.height - 1), octile).solve()),
+        ('Brushfire', brushfire),
+        ('Voronoi', lambda costmap: VoronoiExpansion(costmap).solve()),
+        ('Potential field', lambda costmap: PotentialField(costmap).solve()),
+    ]
+    for name, run in runs:
+        maps = [Costmap2D(10, 20, resolution=0.5),
+                SparseCostmap2D(10, 20, resolution=0.5, tile_size=8)]
+        for costmap in maps:
+            costmap.on_update = None
+            Obstacle(3, 3, 3, 3).draw(costmap)
+            Obstacle(5, 9, 3, 3).draw(costmap)
+            run(costmap)
+        print name, 'same on dense and sparse maps:', \
+            (maps[0].data == maps[1].data).all()
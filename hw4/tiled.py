@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Tiled, process parallel computation of fields over a costmap.
+
+The costmap is split into square tiles, each computed by a worker process
+from the obstacles in the tile and a halo around it that is as wide as the
+field's reach, so the tiles stitch together without seams.  The obstacles
+and the result are in shared memory (multiprocessing.sharedctypes), so the
+workers read and write them in place instead of pickling arrays.
+"""
+
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+
+from costmap import Costmap2D
+from obstacle import Obstacle
+from distancetransform import metrics
+from potentialfield import PotentialField, convolve, repulsion_kernel
+
+# The shared arrays of a worker, set by init_worker
+shared = {}
+
+
+def init_worker(blocked, result, shape):
+    shared['blocked'] = np.frombuffer(blocked, dtype=np.uint8).reshape(shape)
+    shared['result'] = np.frombuffer(result, dtype=np.float64).reshape(shape)
+
+
+def tiles(width, height, tile_size):
+    """Returns x0, x1, y0, y1 of every tile (exclusive ends)"""
+    return [(x, min(x + tile_size, width), y, min(y + tile_size, height))
+            for x in range(0, width, tile_size)
+            for y in range(0, height, tile_size)]
+
+
+def halo_window(tile, halo, shape):
+    """
+    Returns the slices of the tile grown by halo, clipped to the map, and
+    the slices of the tile inside that window.
+    """
+    x0, x1, y0, y1 = tile
+    wx0, wy0 = max(0, x0 - halo), max(0, y0 - halo)
+    wx1, wy1 = min(shape[0], x1 + halo), min(shape[1], y1 + halo)
+    return (np.s_[wx0:wx1, wy0:wy1],
+            np.s_[x0 - wx0:x1 - wx0, y0 - wy0:y1 - wy0])
+
+
+def repulsion_tile(args):
+    """Worker, writes the summed repulsion of one tile"""
+    tile, roi = args
+    kernel = repulsion_kernel(roi)
+    window, inner = halo_window(tile, kernel.shape[0] // 2,
+                                shared['blocked'].shape)
+    repulsion = convolve(shared['blocked'][window].astype(bool), kernel)
+    x0, x1, y0, y1 = tile
+    shared['result'][x0:x1, y0:y1] = repulsion[inner]
+
+
+def distance_tile(args):
+    """Worker, writes the capped obstacle distance of one tile"""
+    tile, metric, max_distance = args
+    window, inner = halo_window(tile, int(np.ceil(max_distance)),
+                                shared['blocked'].shape)
+    distance = metrics[metric](shared['blocked'][window].astype(bool))
+    x0, x1, y0, y1 = tile
+    shared['result'][x0:x1, y0:y1] = np.minimum(distance[inner], max_distance)
+
+
+def run_tiles(blocked, worker, args, tile_size, processes):
+    """Runs worker over every tile in a pool, returns the stitched result"""
+    shape = blocked.shape
+    shared_blocked = RawArray('B', blocked.size)
+    shared_result = RawArray('d', blocked.size)
+    np.frombuffer(shared_blocked, dtype=np.uint8)[:] = blocked.ravel()
+    tasks = [(tile,) + tuple(args) for tile in tiles(shape[0], shape[1],
+                                                      tile_size)]
+    pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                initargs=(shared_blocked, shared_result, shape))
+    try:
+        pool.map(worker, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    return np.frombuffer(shared_result, dtype=np.float64).reshape(shape)
+
+
+def tiled_repulsion(blocked, roi, tile_size=512, processes=None):
+    """
+    Returns the summed repulsion of the obstacles in blocked (see
+    PotentialField), computed in tiles by processes workers.
+    """
+    return run_tiles(blocked, repulsion_tile, (roi,), tile_size, processes)
+
+
+def tiled_distance(costmap, max_distance, metric='euclidean', tile_size=512,
+                   processes=None):
+    """
+    Returns the distance in map units from every cell to the nearest
+    obstacle, capped at max_distance (map units), computed in tiles by
+    processes workers.  The cap bounds the halo each tile needs.
+    """
+    cells = max_distance / costmap.resolution
+    distance = run_tiles(costmap.data == -1, distance_tile,
+                         (metric, cells), tile_size, processes)
+    return (distance * costmap.resolution).astype(np.float32)
+
+
+class TiledPotentialField(PotentialField):
+    """
+    A vectorized PotentialField whose repulsion is computed in tiles by a
+    pool of processes.
+    """
+    def __init__(self, costmap, start = (0,0), goal = None, tile_size=512,
+                 processes=None):
+        PotentialField.__init__(self, costmap, start, goal, vectorized=True)
+        self.tile_size = tile_size
+        self.processes = processes
+
+    def add_repulsion(self):
+        """Adds the repulsion of every obstacle to the potential"""
+        if self.blocked.any():
+            self.potential += self.krep * tiled_repulsion(
+                self.blocked, self.roi, self.tile_size, self.processes)
+            self.potential[self.blocked] = np.inf
+
+
+if __name__ == '__main__':
+    import time
+    import random
+
+    c = Costmap2D(2000, 2000)
+    r = random.Random(0)
+    for i in range(150):
+        Obstacle(r.randrange(2000), r.randrange(2000),
+                 r.randint(10, 100), r.randint(10, 100)).draw(c)
+
+    for processes in (1, multiprocessing.cpu_count()):
+        start = time.time()
+        tiled_distance(c, 50.0, processes=processes)
+        end = time.time()
+        print 'Distance, %d processes:' % processes, end - start
+
+        start = time.time()
+        pf = TiledPotentialField(c, processes=processes)
+        pf.prepare_potential()
+        pf.add_repulsion()
+        end = time.time()
+        print 'Potential, %d processes:' % processes, end - start
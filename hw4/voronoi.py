@@ -1,28 +1,76 @@
 #!/usr/bin/env python
 
-from brushfire import BrushfireExpansion
+import numpy as np
+
+from brushfire import BrushfireExpansion, label_components
+from distancetransform import euclidean_distance
 
 from costmap import Costmap2D
 from obstacle import Obstacle
 
+def voronoi_ridges(costmap):
+    """
+    Returns the generalized Voronoi diagram of the obstacles and the four
+    sides of the map as (ridge, clearance, labels).
+    
+    ridge is True at the free cells where the areas nearest to two different
+    obstacles meet, clearance is the distance from every cell to the nearest
+    obstacle or side (float32, map units) and labels numbers which one that
+    is: the obstacles (8-connected components of -1 cells) 1, 2, ... and then
+    the sides.
+    """
+    blocked = costmap.data == -1
+    labels = np.zeros((costmap.width + 2, costmap.height + 2), dtype=np.int32)
+    labels[1:-1, 1:-1] = label_components(blocked)
+    sides = labels.max()
+    labels[0, :] = sides + 1
+    labels[-1, :] = sides + 2
+    labels[1:-1, 0] = sides + 3
+    labels[1:-1, -1] = sides + 4
+    distance, nearest = euclidean_distance(labels > 0, return_nearest=True)
+    labels = labels.ravel()[nearest][1:-1, 1:-1]
+    distance = distance[1:-1, 1:-1]
+    
+    # Of two neighbors nearest to different obstacles the one further from
+    # them is on the ridge, the first one on a tie, so ridges are thin
+    ridge = np.zeros(blocked.shape, dtype=bool)
+    for first, second in ((np.s_[:-1, :], np.s_[1:, :]),
+                          (np.s_[:, :-1], np.s_[:, 1:])):
+        differ = labels[first] != labels[second]
+        ridge[first] |= differ & (distance[first] >= distance[second])
+        ridge[second] |= differ & (distance[second] > distance[first])
+    ridge &= ~blocked
+    return ridge, (distance * costmap.resolution).astype(np.float32), labels
+
+
 class VoronoiExpansion(BrushfireExpansion):
     """This class represents a Voronoi algorithm using a brushfire style expansion"""
-    def __init__(self, costmap):
-        BrushfireExpansion.__init__(self, costmap)
+    def __init__(self, costmap, vectorized=False):
+        BrushfireExpansion.__init__(self, costmap, vectorized)
         self.set_ignition_cells(self.get_boundry_cells())
+        
+        # The voronoi lines, see voronoi_ridges
+        self.ridge = None
+        self.clearance = None
+        self.obstacle_labels = None
     
     def get_boundry_cells(self):
-        """This gets the cells around the perimeter of the map and from around the obstacles"""
-        boundry_cells = []
-        for (x, row) in enumerate(self.costmap):
-            for (y, cell) in enumerate(row):
-                # If cell has been set (!=0) don't process
-                if cell == 0.0:
-                    # If it is on the edge of the map or If it touches an non-traversable
-                    if self.on_edge(x,y) or \
-                     -1.0 in self.costmap.get_cell_values(self.costmap.get_neighbors(x,y)):
-                        boundry_cells.append((x,y))
-        return boundry_cells
+        """
+        This gets the cells around the perimeter of the map and from around the obstacles
+        
+        Returns an (N, 2) array of the unset (0) cells that are on the edge of
+        the map or touch a non-traversable (-1) cell.
+        """
+        data = self.costmap.data
+        blocked = np.pad(data == -1, 1, mode='constant')
+        boundry = np.zeros(data.shape, dtype=bool)
+        boundry[[0, -1], :] = True
+        boundry[:, [0, -1]] = True
+        for dx in (0, 1, 2):
+            for dy in (0, 1, 2):
+                if dx != 1 or dy != 1:
+                    boundry |= blocked[dx:dx + data.shape[0], dy:dy + data.shape[1]]
+        return np.argwhere(boundry & (data == 0))
     
     def on_edge(self, x, y):
         """Returns True if the cell at x,y is on the edge of the map, otherwise False"""
@@ -36,7 +84,19 @@ class VoronoiExpansion(BrushfireExpansion):
         """Solves the voronoi algorithm"""
         BrushfireExpansion.solve(self)
         # Now extract the voronoi lines
-        # TODO: extract the voronoi lines
+        self.extract_ridges()
+    
+    def extract_ridges(self):
+        """Extracts the voronoi lines, returns the ridge cells as a bool array"""
+        self.ridge, self.clearance, self.obstacle_labels = \
+            voronoi_ridges(self.costmap)
+        return self.ridge
+    
+    def draw_ridges(self, value=-20):
+        """Draws the voronoi lines in the costmap"""
+        if self.ridge is None:
+            self.extract_ridges()
+        self.costmap[self.ridge] = value
     
 
 if __name__ == '__main__':
@@ -46,6 +106,7 @@ if __name__ == '__main__':
     Obstacle(4,16,3,3).draw(c)
     ve = VoronoiExpansion(c)
     ve.solve()
+    ve.draw_ridges()
     try:
         from matplotlib.pylab import imshow, show
         imshow(c.data.T, interpolation='nearest')